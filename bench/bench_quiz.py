@@ -0,0 +1,200 @@
+# bench_quiz.py
+"""
+End-to-end load benchmark against a local quiz engine.
+
+Starts the engine in a child process with a synthetic multiple-choice deck,
+joins simulated players from this process, plays a timed quiz and reports
+join time, question fan-out and answer-to-score latency percentiles, plus
+the server's CPU time and peak memory per player.
+
+    python bench/bench_quiz.py --players 1000 --questions 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import resource
+import sys
+import time
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, "server"))
+sys.path.append(os.path.join(ROOT, "client"))
+
+RESULT_PREFIX = "BENCH "  # marks the child's machine-readable lines in its output
+# Lines in the server's stderr that mean something went wrong, even if every player finished
+SERVER_ERROR_MARKERS = ("Traceback", "Exception in callback", "socket.send() raised exception")
+
+
+def raise_file_limit(needed):
+    """Thousands of sockets need more descriptors than the usual soft limit"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    wanted = needed if hard == resource.RLIM_INFINITY else min(needed, hard)
+    if soft < wanted:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (wanted, hard))
+
+
+def synthetic_questions(count):
+    return [{
+        "question": f"Benchmark question {number + 1}",
+        "type": "multiple_choice",
+        "options": ["A", "B", "C", "D"],
+        "correct": number % 4,
+        "image": None
+    } for number in range(count)]
+
+
+def report(line):
+    print(RESULT_PREFIX + json.dumps(line), flush=True)
+
+
+def serve(args):
+    """Child process: run the engine until the quiz ends, then report resource usage"""
+    import queue
+    import tempfile
+    from quiz_engine import QuizEngine
+    from gateway import start_gateways, stop_gateways
+
+    raise_file_limit(args.players * 2 + 256)
+    gateway_path = (os.path.join(tempfile.gettempdir(), f"quiz-bench-{os.getpid()}.sock")
+                    if args.gateways else None)
+    engine = QuizEngine("127.0.0.1", args.port, advance_delay=args.advance_delay,
+                        gateway_path=gateway_path)
+    engine.start()
+    gateways = start_gateways(args.gateways, gateway_path, "127.0.0.1", args.port)
+    engine.call(engine.load_questions, synthetic_questions(args.questions))
+    engine.call(engine.set_timer, True, args.question_time)
+    report({"event": "ready"})
+
+    started = False
+    deadline = time.monotonic() + args.lobby_timeout
+    while True:
+        try:
+            event, data = engine.events.get(timeout=0.5)
+        except queue.Empty:
+            event, data = None, None
+        if event == "players" and not started and len(data["players"]) >= args.players:
+            started = True
+            engine.call(engine.start_quiz)
+        elif event == "quiz_ended":
+            break
+        if not started and time.monotonic() > deadline:
+            print("Lobby timed out before every bot joined")
+            break
+
+    engine.stop()
+    stop_gateways(gateways)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # Gateway processes have been joined, so their time shows up under children
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    report({
+        "event": "done",
+        "cpu_seconds": usage.ru_utime + usage.ru_stime + children.ru_utime + children.ru_stime,
+        "engine_cpu_seconds": usage.ru_utime + usage.ru_stime,
+        "max_rss_kb": usage.ru_maxrss,  # kilobytes on Linux
+        "metrics": engine.metrics.snapshot()
+    })
+
+
+async def drive(args):
+    from load_bot import run_bots
+
+    raise_file_limit(args.players + 256)
+    child = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "--serve",
+        "--port", str(args.port), "--players", str(args.players),
+        "--questions", str(args.questions), "--question-time", str(args.question_time),
+        "--advance-delay", str(args.advance_delay), "--lobby-timeout", str(args.lobby_timeout),
+        "--gateways", str(args.gateways),
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    ready = asyncio.get_running_loop().create_future()
+    results = {}
+    server_errors = []
+
+    async def read_child():
+        # Keep draining the pipe so the server's logging never blocks it
+        async for raw in child.stdout:
+            line = raw.decode("utf-8", "replace").rstrip()
+            if not line.startswith(RESULT_PREFIX):
+                if args.verbose:
+                    print(f"[server] {line}")
+                continue
+            message = json.loads(line[len(RESULT_PREFIX):])
+            results[message["event"]] = message
+            if message["event"] == "ready" and not ready.done():
+                ready.set_result(True)
+
+    async def read_child_errors():
+        async for raw in child.stderr:
+            line = raw.decode("utf-8", "replace").rstrip()
+            print(f"[server] {line}", file=sys.stderr)
+            if line.startswith(SERVER_ERROR_MARKERS):
+                server_errors.append(line)
+
+    reader_task = asyncio.ensure_future(read_child())
+    error_task = asyncio.ensure_future(read_child_errors())
+    await asyncio.wait_for(ready, 30)
+
+    started = time.monotonic()
+    stats = await run_bots("127.0.0.1", args.port, args.players, args.answer_time,
+                           args.jitter, args.connect_concurrency, seed=args.seed)
+    elapsed = time.monotonic() - started
+    await child.wait()
+    await reader_task
+    await error_task
+
+    summary = stats.summary()
+    summary["players"] = args.players
+    summary["questions"] = args.questions
+    summary["wall_seconds"] = round(elapsed, 2)
+    summary["server_errors"] = len(server_errors)
+    server = results.get("done")
+    if server:
+        summary["server_cpu_seconds"] = round(server["cpu_seconds"], 3)
+        summary["engine_cpu_seconds"] = round(server["engine_cpu_seconds"], 3)
+        summary["server_max_rss_kb"] = server["max_rss_kb"]
+        summary["server_cpu_ms_per_player"] = round(server["cpu_seconds"] * 1000 / args.players, 3)
+        summary["server_rss_kb_per_player"] = round(server["max_rss_kb"] / args.players, 1)
+        if args.json:
+            summary["server_metrics"] = server["metrics"]
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the quiz engine with simulated players")
+    parser.add_argument("--players", type=int, default=200)
+    parser.add_argument("--questions", type=int, default=3)
+    parser.add_argument("--question-time", type=int, default=5)
+    parser.add_argument("--advance-delay", type=float, default=1)
+    parser.add_argument("--answer-time", default="uniform:0.5,3",
+                        help="fixed:S, uniform:A,B, normal:MEAN,SD or exp:MEAN (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--lobby-timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--gateways", type=int, default=0,
+                        help="serve players from this many gateway processes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the summary to this file")
+    parser.add_argument("--verbose", action="store_true", help="echo the server's output")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.serve:
+        serve(args)
+        return
+
+    summary = asyncio.run(drive(args))
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    # Non-zero exit lets CI notice players that never made it through the quiz,
+    # and tracebacks or failed writes in the server's output
+    if summary["finished"] < args.players or summary["server_errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
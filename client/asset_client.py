@@ -0,0 +1,163 @@
+# asset_client.py
+import itertools
+import os
+import queue
+import socket
+import sys
+import threading
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import CHANNEL_ASSETS, asset_hash, client_handshake, send_message
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+PRIORITY_SHOW = 0  # the image of the question on screen
+PRIORITY_PREFETCH = 1
+
+
+class ImageCache:
+    """Content-addressed image cache: memory first, then files named by hash"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR):
+        self.directory = directory
+        self.memory = {}
+        self.lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def path_for(self, digest):
+        return os.path.join(self.directory, digest)
+
+    def get(self, digest):
+        """Return cached bytes for a hash, or None"""
+        with self.lock:
+            data = self.memory.get(digest)
+        if data is not None:
+            return data
+        try:
+            with open(self.path_for(digest), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        # Ignore corrupted files, they will be downloaded again
+        if asset_hash(data) != digest:
+            return None
+        with self.lock:
+            self.memory[digest] = data
+        return data
+
+    def put(self, digest, data):
+        """Store bytes under their hash; rejects data that does not match"""
+        if asset_hash(data) != digest:
+            raise ValueError(f"Asset does not match hash {digest}")
+        with self.lock:
+            self.memory[digest] = data
+        temp_path = self.path_for(digest) + ".tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, self.path_for(digest))
+        except OSError as e:
+            print(f"Could not write image cache: {e}")
+
+
+class AssetClient:
+    """
+    Download images over a separate connection so question messages
+    never wait behind image bytes.
+
+    Requests are served by one background thread; callbacks run on that
+    thread, so Tk callers should hop back with window.after. An image
+    needed on screen goes ahead of queued prefetches. Every image that ends
+    up in the cache is acknowledged to the server so the host can see
+    prefetch progress.
+    """
+
+    def __init__(self, server_ip, server_port, player_name, cache=None, room=None):
+        self.server_ip = server_ip
+        self.server_port = server_port
+        self.player_name = player_name
+        self.room = room
+        self.cache = cache or ImageCache()
+        self.requests = queue.PriorityQueue()  # (priority, order, digest, callback)
+        self.order = itertools.count()  # first in, first out within a priority
+        self.acknowledged = set()  # acks sent on the current side connection
+        self.sock = None
+        self.reader = None
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def request(self, digest, callback):
+        """Call callback(digest, data) once the image is available"""
+        data = self.cache.get(digest)
+        if data is not None:
+            callback(digest, data)
+            return
+        self.requests.put((PRIORITY_SHOW, next(self.order), digest, callback))
+
+    def prefetch(self, digests):
+        """Queue background downloads for images announced by the server"""
+        for digest in digests:
+            self.requests.put((PRIORITY_PREFETCH, next(self.order), digest, None))
+
+    def connect(self):
+        self.sock = socket.create_connection((self.server_ip, self.server_port), timeout=5)
+        self.reader = client_handshake(self.sock, self.player_name, CHANNEL_ASSETS, room=self.room)
+        self.sock.settimeout(None)
+        # A new connection may reach a restarted server or a new session that
+        # knows nothing of earlier acks: acknowledge everything again
+        self.acknowledged.clear()
+
+    def close(self):
+        if self.sock:
+            self.sock.close()
+        self.sock = None
+        self.reader = None
+
+    def fetch(self, digest):
+        """Download one asset, reconnecting the side channel if needed"""
+        if self.sock is None:
+            self.connect()
+        send_message(self.sock, {"type": "get_asset", "hash": digest})
+        while True:
+            message = self.reader.read_message()
+            if message.get("hash") != digest:
+                continue
+            if message["type"] == "asset_missing":
+                return None
+            return message["data"]
+
+    def acknowledge(self, digest):
+        """Tell the server this image is cached and ready to show"""
+        if digest in self.acknowledged:
+            return
+        if self.sock is None:
+            self.connect()
+        send_message(self.sock, {"type": "asset_ready", "hash": digest})
+        self.acknowledged.add(digest)
+
+    def run(self):
+        while True:
+            _, _, digest, callback = self.requests.get()
+            # Another request may have fetched it while this one was queued
+            data = self.cache.get(digest)
+            if data is None:
+                try:
+                    data = self.fetch(digest)
+                except Exception as e:
+                    print(f"Error fetching image {digest[:12]}: {e}")
+                    self.close()
+                    continue
+                if data is None:
+                    print(f"Server has no image {digest[:12]}")
+                    continue
+                try:
+                    self.cache.put(digest, data)
+                except ValueError as e:
+                    print(f"Error caching image: {e}")
+                    continue
+            try:
+                self.acknowledge(digest)
+            except Exception as e:
+                print(f"Error acknowledging image {digest[:12]}: {e}")
+                self.close()
+            if callback:
+                callback(digest, data)
@@ -1,6 +1,9 @@
 import socket
 import threading
-import json
+import math
+import random
+import time
+from collections import deque
 import tkinter as tk
 from tkinter import ttk
 from tkinter import messagebox
@@ -9,14 +12,46 @@ import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils import CustomStyle
-import base64
+from protocol import ProtocolError, client_handshake, send_message
+from asset_client import AssetClient
 from io import BytesIO
 
+CLOCK_SAMPLES = 8  # recent ping exchanges kept for the clock offset estimate
+CLOCK_SYNC_FAST_MS = 500  # ping spacing until the first samples are in
+CLOCK_SYNC_INTERVAL_MS = 10000  # then resync now and then to follow clock drift
+TIMER_REFRESH_MS = 250
+RECONNECT_BASE_MS = 500  # first retry delay, doubled on every failed attempt
+RECONNECT_MAX_MS = 8000
+RECONNECT_WINDOW = 30  # seconds to keep retrying; matches the server's session grace
+WATCHDOG_MS = 1000  # how often to check that the server is still talking
+
 # client.py
 class QuizClient:
     def __init__(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket = None
+        self.reader = None
+        self.session = None  # token from the welcome, lets a dropped player resume
+        self.session_seat = None  # (server, port, name, room) the token belongs to
+        self.reconnect_started = None
+        self.assets = None
+        self.current_image_hash = None
+        self.send_lock = threading.Lock()  # answers and clock pings share the socket
+        self.top_scores = []  # [player, score] pairs, best first
+        self.player_count = 0
+        self.my_rank = None
+        self.my_score = 0
+        self.leaderboard_seq = 0  # version of the standings shown, to skip stale updates
+        self.rank_seq = 0
+        self.connected = False
+        self.last_received = 0.0  # monotonic time of the last message from the server
+        self.server_timeout = None  # silence allowed before giving up, sent with heartbeats
+        self.watchdog_job = None
+        self.clock_job = None
+        self.clock_samples = deque(maxlen=CLOCK_SAMPLES)  # (round trip, offset) pairs
+        self.clock_offset = 0.0  # server clock minus local clock, in seconds
+        self.deadline = None  # server time the current question closes
+        self.timer_job = None
+        self.answer_submitted = False
         self.setup_gui()
         
     def setup_gui(self):
@@ -82,6 +117,15 @@ class QuizClient:
         
         self.name_entry = ttk.Entry(name_frame, width=20)
         self.name_entry.pack(side=tk.LEFT, padx=5)
+
+        ttk.Label(name_frame,
+                 text="Room Code:",
+                 font=("Helvetica", 10),
+                 style="Custom.TLabel").pack(side=tk.LEFT, padx=(10, 0))
+
+        # Only needed when the server hosts several quizzes at once
+        self.room_entry = ttk.Entry(name_frame, width=8)
+        self.room_entry.pack(side=tk.LEFT, padx=5)
         
         # Connect button
         self.connect_button = ttk.Button(connection_frame,
@@ -162,7 +206,7 @@ class QuizClient:
         scores_frame.pack(fill=tk.BOTH, expand = True, pady=10)
         
         self.scores_label = ttk.Label(scores_frame,
-                                    text="Your Score: 0\nOther Players: None",
+                                    text="Your Score: 0\nLeaderboard: None",
                                     font=("Helvetica", 12),
                                     style="Custom.TLabel",
                                     justify="center")
@@ -232,76 +276,160 @@ class QuizClient:
             if not player_name:
                 messagebox.showerror("Error", "Please enter your name")
                 return
-                
-            # Try to connect to the server
-            self.socket.settimeout(5)  # 5 seconds timeout
-            self.socket.connect((server_ip, server_port))
-            self.socket.settimeout(None)  # Remove timeout
 
-            # Send player name
-            self.socket.send(player_name.encode())
-            
-            # Start listening for server messages
-            receive_thread = threading.Thread(target=self.receive_messages)
-            receive_thread.daemon = True
-            receive_thread.start()
+            room = self.room_entry.get().strip() or None
+            if (server_ip, server_port, player_name, room) != self.session_seat:
+                self.session = None  # A fresh join, not a resume
+            # Otherwise the token outlived the automatic retries: try to get our seat back
+            offered = self.session
+            self.open_connection(server_ip, server_port, player_name)
+            self.session_seat = (server_ip, server_port, player_name, room)
+
+            # Images are downloaded on a side connection and cached by hash
+            self.assets = AssetClient(server_ip, server_port, player_name, room=room)
             
             # Update GUI
             self.connect_button.config(state=tk.DISABLED)
-            self.status_label.config(text="Connected to server")
+            resumed = bool(offered) and self.reader.resumed
+            self.status_label.config(text="Reconnected to server" if resumed else "Connected to server")
+            if offered and not resumed:
+                messagebox.showwarning("Connected",
+                                       "Your session expired while you were away, so your previous "
+                                       "score was lost. You play on from zero.")
             self.ip_entry.config(state=tk.DISABLED)
             self.port_entry.config(state=tk.DISABLED)
             self.name_entry.config(state=tk.DISABLED)
+            self.room_entry.config(state=tk.DISABLED)
             
         except socket.timeout:
             messagebox.showerror("Error", "Connection timed out. Please check the server IP and port.")
+        except ProtocolError as e:
+            messagebox.showerror("Error", f"Server rejected connection: {str(e)}")
         except ValueError:
             messagebox.showerror("Error", "Invalid port number")
         except Exception as e:
             messagebox.showerror("Error", f"Could not connect to server: {str(e)}")
     
+    def open_connection(self, server_ip, server_port, player_name):
+        """Connect and handshake, resuming the session if there is one"""
+        sock = socket.create_connection((server_ip, server_port), timeout=5)
+        try:
+            # Join handshake: send player name and wait for the server's welcome
+            reader = client_handshake(sock, player_name, session=self.session,
+                                      room=self.room_entry.get().strip() or None)
+        except Exception:
+            sock.close()
+            raise
+        sock.settimeout(None)  # Remove timeout
+        self.socket = sock
+        self.reader = reader
+        self.session = reader.session
+        # Sequence numbers start over with every server process
+        self.leaderboard_seq = 0
+        self.rank_seq = 0
+
+        # Start listening for server messages
+        receive_thread = threading.Thread(target=self.receive_messages, args=(reader,))
+        receive_thread.daemon = True
+        receive_thread.start()
+        self.connected = True
+        self.last_received = time.monotonic()
+        self.sync_clock()
+        self.watchdog_job = self.window.after(WATCHDOG_MS, self.check_server)
+
+    def check_server(self):
+        """Drop a connection the server stopped heartbeating on; the resume logic takes over"""
+        self.watchdog_job = None
+        if not self.connected:
+            return
+        silent = time.monotonic() - self.last_received
+        if self.server_timeout and silent > self.server_timeout:
+            print(f"No heartbeat from server for {silent:.1f}s, reconnecting")
+            try:
+                # Wakes the receive thread, which then reports the disconnect
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            return
+        self.watchdog_job = self.window.after(WATCHDOG_MS, self.check_server)
+
     def handle_disconnect(self):
         """Handle disconnection from server"""
+        self.connected = False
+        for job in (self.clock_job, self.watchdog_job):
+            if job is not None:
+                self.window.after_cancel(job)
+        self.clock_job = None
+        self.watchdog_job = None
         self.socket.close()
+        if self.assets:
+            self.assets.close()
+        if self.session:
+            # The server holds our score for a while; try to resume before giving up
+            self.status_label.config(text="Connection lost, reconnecting...")
+            self.reconnect_started = time.monotonic()
+            self.schedule_reconnect(0)
+            return
+        self.show_disconnected()
+
+    def schedule_reconnect(self, attempt):
+        # Jittered backoff so a room that dropped together does not reconnect together
+        delay = min(RECONNECT_MAX_MS, RECONNECT_BASE_MS * 2 ** attempt)
+        self.window.after(int(delay * random.uniform(0.5, 1.5)), self.reconnect, attempt)
+
+    def reconnect(self, attempt):
+        try:
+            self.open_connection(self.ip_entry.get(), int(self.port_entry.get()), self.name_entry.get())
+        except ProtocolError as e:
+            # Refused, e.g. a room not reopened yet: the token stays for connecting by hand
+            print(f"Could not resume session: {e}")
+            self.show_disconnected()
+            return
+        except OSError as e:
+            if time.monotonic() - self.reconnect_started < RECONNECT_WINDOW:
+                self.schedule_reconnect(attempt + 1)
+            else:
+                # A recovered server holds our seat much longer than we retry:
+                # keep the token, so pressing Connect later still resumes
+                print(f"Giving up reconnecting: {e}")
+                self.show_disconnected()
+            return
+        if not self.reader.resumed:
+            # The server let our session expire and seated us as a new player
+            self.status_label.config(text="Reconnected as a new player")
+            messagebox.showwarning("Reconnected",
+                                   "Your session expired while you were away, so your previous score "
+                                   "was lost. You keep playing from zero.")
+            return
+        self.status_label.config(text="Reconnected to server")
+
+    def show_disconnected(self):
+        self.stop_timer()
         self.status_label.config(text="Disconnected from server")
         self.connect_button.config(state=tk.NORMAL)
         self.ip_entry.config(state=tk.NORMAL)
         self.port_entry.config(state=tk.NORMAL)
         self.name_entry.config(state=tk.NORMAL)
+        self.room_entry.config(state=tk.NORMAL)
         
         for button in self.answer_buttons:
             button.config(state=tk.DISABLED)
             
         messagebox.showwarning("Disconnected", "Lost connection to server")
             
-    def receive_messages(self):
-        buffer = ""
+    def receive_messages(self, reader):
         while True:
             try:
-                # Receive data in chunks
-                chunk = self.socket.recv(4096).decode()  # Increased buffer size for images
-                if not chunk:
-                    break
-                    
-                buffer += chunk
-                
-                try:
-                    # Try to parse the complete message
-                    message = json.loads(buffer)
-                    # If successful, process the message and clear buffer
-                    self.handle_message(message)
-                    buffer = ""
-                except json.JSONDecodeError:
-                    # If we can't parse yet, continue receiving more data
-                    continue
+                # Each frame holds exactly one message, no matter how TCP splits it
+                message = reader.read_message()
+                self.last_received = time.monotonic()
+                self.handle_message(message)
                     
             except socket.error as e:
                 print(f"Socket error: {e}")
-                self.window.after(0, self.handle_disconnect)
                 break
             except Exception as e:
                 print(f"Error in receive_messages: {e}")
-                self.window.after(0, self.handle_disconnect)
                 break
                 
         self.window.after(0, self.handle_disconnect)
@@ -311,40 +439,16 @@ class QuizClient:
             question_data = message["data"]
             self.question_label.config(text=f"Question {question_data['question_number']}/{question_data['total_questions']}: {question_data['question']}")            
             
-             # Handle image if present
-            if "image" in question_data and question_data["image"]:
-                try:
-                    # Clear any existing image
-                    self.image_label.config(image='')
-                    
-                    # Decode and display image
-                    image_data = base64.b64decode(question_data["image"])
-                    image = Image.open(BytesIO(image_data))
-                    
-                    # Calculate new dimensions while maintaining aspect ratio
-                    max_width = 800
-                    max_height = 600
-                    ratio = min(max_width/image.width, max_height/image.height)
-                    new_width = int(image.width * ratio)
-                    new_height = int(image.height * ratio)
-                    
-                    image = image.resize((new_width, new_height), Image.LANCZOS)
-                    photo = ImageTk.PhotoImage(image)
-                    self.image_label.config(image=photo)
-                    self.image_label.image = photo  # Keep a reference!
-                except Exception as e:
-                    print(f"Error displaying image: {str(e)}")
-                    self.image_label.config(image='')
-            else:
-                self.image_label.config(image='')
+            # Image is referenced by hash: show the text now, the image once it is cached
+            self.image_label.config(image='')
+            self.current_image_hash = question_data.get("image_hash")
+            if self.current_image_hash and self.assets:
+                self.assets.request(self.current_image_hash,
+                                    lambda digest, data: self.window.after(0, self.show_image, digest, data))
             
-            # Handle timer
-            if question_data["timer_mode"]:
-                self.time_remaining = question_data["time_limit"]
-                self.timer_label.config(text=f"Time remaining: {self.time_remaining}s")
-                self.window.after(1000, self.update_timer)
-            else:
-                self.timer_label.config(text="")
+            # Handle timer: count down to the server's deadline, not from arrival
+            self.answer_submitted = False
+            self.window.after(0, self.start_timer, question_data.get("deadline"))
 
             # Show appropriate answer input
             if question_data["type"] == "multiple_choice":
@@ -358,9 +462,18 @@ class QuizClient:
                 self.answer_entry.config(state=tk.NORMAL)
                 self.answer_entry.delete(0, tk.END)
                 self.submit_text_button.config(state=tk.NORMAL)
+
+            if question_data.get("answered"):
+                # Replayed after a reconnect: our answer already reached the server
+                self.answer_submitted = True
+                for button in self.answer_buttons:
+                    button.config(state=tk.DISABLED)
+                self.answer_entry.config(state=tk.DISABLED)
+                self.submit_text_button.config(state=tk.DISABLED)
+                self.timer_label.config(text="Answer submitted")
         
         elif message["type"] == "end":
-            self.update_scores(message["data"])
+            self.apply_leaderboard(message)
             self.question_label.config(text="Quiz has ended!")
             # Disable answer inputs
             for button in self.answer_buttons:
@@ -368,16 +481,48 @@ class QuizClient:
             self.answer_entry.config(state=tk.DISABLED)
             self.submit_text_button.config(state=tk.DISABLED)
             
-        elif message["type"] == "score_update":
-            self.update_scores(message["data"])
+        elif message["type"] == "question_closed":
+            # The server stopped taking answers; anything sent now would be ignored
+            self.window.after(0, self.stop_timer)
+            for button in self.answer_buttons:
+                button.config(state=tk.DISABLED)
+            self.answer_entry.config(state=tk.DISABLED)
+            self.submit_text_button.config(state=tk.DISABLED)
+            points = message.get("points", {}).get(self.name_entry.get())
+            if points:
+                self.timer_label.config(text=f"Correct! +{points} points")
+            elif not self.answer_submitted:
+                self.timer_label.config(text="Time's up!")
+            
+        elif message["type"] == "heartbeat":
+            self.server_timeout = message.get("timeout")
+            self.send({"type": "heartbeat_ack", "sent": message["sent"]})
+            
+        elif message["type"] == "pong":
+            self.add_clock_sample(message)
+            
+        elif message["type"] == "prefetch":
+            # Download upcoming images in the background so questions show instantly
+            if self.assets:
+                self.assets.prefetch(message["hashes"])
+            
+        elif message["type"] == "leaderboard":
+            self.apply_leaderboard(message)
+            
+        elif message["type"] == "rank":
+            # Only our own standing is sent, not the whole table
+            if message.get("seq", 0) < self.rank_seq:
+                return  # older than the standing on screen
+            self.rank_seq = message.get("seq", 0)
+            self.my_rank = message["rank"]
+            self.my_score = message["score"]
+            self.update_scores()
             
         elif message["type"] == "restart":
-            self.update_scores(message["data"])
             self.question_label.config(text="Waiting for question...")
             # Clear timer and stop any running timer updates
-            self.timer_label.config(text="")
-            if hasattr(self, 'time_remaining'):
-                delattr(self, 'time_remaining')
+            self.window.after(0, self.start_timer, None)
+            self.current_image_hash = None
             self.image_label.config(image="")
             # Reset answer inputs
             for button in self.answer_buttons:
@@ -387,21 +532,89 @@ class QuizClient:
             self.mcq_frame.pack_forget()
             self.short_answer_frame.pack_forget()
                 
+    def show_image(self, digest, image_data):
+        # Skip images that arrive after the question has moved on
+        if digest != self.current_image_hash:
+            return
+        try:
+            # The server already scaled the image to fit the display box
+            photo = ImageTk.PhotoImage(Image.open(BytesIO(image_data)))
+            self.image_label.config(image=photo)
+            self.image_label.image = photo  # Keep a reference!
+        except Exception as e:
+            print(f"Error displaying image: {str(e)}")
+            self.image_label.config(image='')
+                
+    def sync_clock(self):
+        """Ping the server; the pong gives one clock offset sample"""
+        if not self.connected:
+            return
+        try:
+            self.send({"type": "ping", "client_time": time.time()})
+        except OSError as e:
+            print(f"Clock sync failed: {e}")
+            return
+        delay = CLOCK_SYNC_FAST_MS if len(self.clock_samples) < CLOCK_SAMPLES // 2 else CLOCK_SYNC_INTERVAL_MS
+        self.clock_job = self.window.after(delay, self.sync_clock)
+
+    def add_clock_sample(self, message):
+        now = time.time()
+        sent = message["client_time"]
+        round_trip = now - sent
+        # Assume the pong was stamped halfway through the round trip
+        offset = message["server_time"] - (sent + now) / 2
+        self.clock_samples.append((round_trip, offset))
+        # The fastest exchange had the least queuing, so its offset is the most accurate
+        self.clock_offset = min(self.clock_samples)[1]
+
+    def server_time(self):
+        return time.time() + self.clock_offset
+
+    def start_timer(self, deadline):
+        """Count down to a server deadline, or clear the timer for None"""
+        self.stop_timer()
+        if deadline is None:
+            self.timer_label.config(text="")
+            return
+        self.deadline = deadline
+        self.update_timer()
+
+    def stop_timer(self):
+        self.deadline = None
+        if self.timer_job is not None:
+            self.window.after_cancel(self.timer_job)
+            self.timer_job = None
+
     def update_timer(self):
-        if hasattr(self, 'time_remaining') and self.time_remaining > 0:
-            self.time_remaining -= 1
-            self.timer_label.config(text=f"Time remaining: {self.time_remaining}s")
-            if self.time_remaining == 0:
-                # Auto-submit empty answer when time runs out
-                self.submit_answer(-1) if self.mcq_frame.winfo_ismapped() else self.submit_text_answer()
-            else:
-                if hasattr(self, 'time_remaining'):
-                    self.window.after(1000, self.update_timer)
+        self.timer_job = None
+        if self.deadline is None or self.answer_submitted:
+            return
+        remaining = self.deadline - self.server_time()
+        if remaining <= 0:
+            self.deadline = None
+            # Auto-submit empty answer when time runs out
+            self.submit_answer(-1) if self.mcq_frame.winfo_ismapped() else self.submit_text_answer()
+            return
+        self.timer_label.config(text=f"Time remaining: {math.ceil(remaining)}s")
+        self.timer_job = self.window.after(TIMER_REFRESH_MS, self.update_timer)
                 
-    def update_scores(self, scores):
-        my_name = self.name_entry.get()
-        other_scores = "\n".join(f"{name}: {score}" for name, score in scores.items() if name != my_name)
-        self.scores_label.config(text=f"Your Score: {scores.get(my_name, 0)}\nOther Players:\n{other_scores or 'None'}")
+    def apply_leaderboard(self, message):
+        if message.get("seq", 0) < self.leaderboard_seq:
+            return  # older than the leaderboard on screen
+        self.leaderboard_seq = message.get("seq", 0)
+        self.top_scores = message["top"]
+        self.player_count = message["players"]
+        self.update_scores()
+        
+    def update_scores(self):
+        rank = f" (#{self.my_rank} of {self.player_count})" if self.my_rank else ""
+        leaders = "\n".join(f"{position}. {name}: {score}"
+                             for position, (name, score) in enumerate(self.top_scores, start=1))
+        self.scores_label.config(text=f"Your Score: {self.my_score}{rank}\nLeaderboard:\n{leaders or 'None'}")
+        
+    def send(self, message):
+        with self.send_lock:
+            send_message(self.socket, message)
         
     def submit_text_answer(self):
         answer = self.answer_entry.get()
@@ -409,7 +622,8 @@ class QuizClient:
             "type": "short_answer",
             "answer": answer
         }
-        self.socket.send(json.dumps(answer_data).encode())
+        self.send(answer_data)
+        self.answer_submitted = True
         self.answer_entry.config(state=tk.DISABLED)
         self.submit_text_button.config(state=tk.DISABLED)
         self.timer_label.config(text="Answer submitted")
@@ -419,7 +633,8 @@ class QuizClient:
             "type": "multiple_choice",
             "answer": answer_index
         }
-        self.socket.send(json.dumps(answer_data).encode())
+        self.send(answer_data)
+        self.answer_submitted = True
         for button in self.answer_buttons:
             button.config(state=tk.DISABLED)
         self.timer_label.config(text="Answer submitted")
@@ -0,0 +1,221 @@
+# load_bot.py
+import argparse
+import asyncio
+import random
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import ProtocolError, client_handshake_async, encode_message, read_message_async
+
+
+def parse_distribution(spec, rng=random):
+    """
+    Turn 'fixed:2', 'uniform:1,5', 'normal:3,1' or 'exp:2' into a callable
+    returning a delay in seconds (never negative).
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value]
+    if kind == "fixed" and len(values) == 1:
+        draw = lambda: values[0]
+    elif kind == "uniform" and len(values) == 2:
+        draw = lambda: rng.uniform(values[0], values[1])
+    elif kind == "normal" and len(values) == 2:
+        draw = lambda: rng.gauss(values[0], values[1])
+    elif kind == "exp" and len(values) == 1:
+        draw = lambda: rng.expovariate(1 / values[0])
+    else:
+        raise ValueError(f"Unknown distribution {spec!r}")
+    return lambda: max(0.0, draw())
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class BotStats:
+    """Measurements shared by every bot in the process"""
+
+    def __init__(self):
+        self.join_times = []  # connect to welcome, seconds
+        self.fanout = []  # server send to bot receive of each question, seconds
+        self.answer_to_score = []  # answer sent to question_closed with points received
+        self.connected = 0
+        self.failures = 0
+        self.answers = 0
+        self.finished = 0
+
+    def summary(self):
+        def describe(values):
+            return {
+                "count": len(values),
+                "p50_ms": round(percentile(values, 0.50) * 1000, 2) if values else None,
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2) if values else None,
+                "p99_ms": round(percentile(values, 0.99) * 1000, 2) if values else None,
+                "max_ms": round(max(values) * 1000, 2) if values else None
+            }
+
+        return {
+            "connected": self.connected,
+            "failures": self.failures,
+            "finished": self.finished,
+            "answers": self.answers,
+            "join": describe(self.join_times),
+            "question_fanout": describe(self.fanout),
+            "answer_to_score": describe(self.answer_to_score)
+        }
+
+
+class LoadBot:
+    """
+    One simulated player speaking the game protocol without Tk.
+
+    Answers every question after a delay drawn from answer_delay, and adds
+    up to jitter seconds of random delay before each message it sends to
+    mimic a noisy network. Bots never fetch images.
+    """
+
+    def __init__(self, name, host, port, stats, answer_delay, jitter=0.0, accuracy=0.7, rng=None,
+                 room=None):
+        self.name = name
+        self.host = host
+        self.port = port
+        self.room = room
+        self.stats = stats
+        self.answer_delay = answer_delay
+        self.jitter = jitter
+        self.accuracy = accuracy  # chance of knowing a short answer
+        self.rng = rng or random.Random()
+        self.reader = None
+        self.writer = None
+        self.codec = None
+        self.answered_at = None
+        self.tasks = set()
+
+    async def join(self):
+        """Connect and handshake; returns False if the server could not be joined"""
+        started = time.monotonic()
+        try:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+            welcome = await client_handshake_async(self.reader, self.writer, self.name,
+                                                   room=self.room)
+        except (OSError, ProtocolError, asyncio.IncompleteReadError) as e:
+            print(f"Bot {self.name} could not join: {e}")
+            self.stats.failures += 1
+            if self.writer:
+                self.writer.close()
+            return False
+        self.stats.join_times.append(time.monotonic() - started)
+        self.stats.connected += 1
+        self.codec = welcome.get("compression")
+        return True
+
+    async def play(self):
+        """Answer questions until the quiz ends or the connection drops"""
+        try:
+            while True:
+                message = await read_message_async(self.reader, self.codec)
+                if self.handle_message(message):
+                    self.stats.finished += 1
+                    break
+        except (OSError, ProtocolError, asyncio.IncompleteReadError):
+            self.stats.failures += 1
+        finally:
+            for task in self.tasks:
+                task.cancel()
+            self.writer.close()
+
+    def handle_message(self, message):
+        """Returns True once the quiz is over"""
+        message_type = message.get("type")
+        if message_type == "question":
+            data = message["data"]
+            if "deadline" in data:
+                # Timed questions carry the server's send time as deadline - time_limit
+                self.stats.fanout.append(time.time() - (data["deadline"] - data["time_limit"]))
+            self.spawn(self.answer(data))
+        elif message_type == "heartbeat":
+            self.spawn(self.send({"type": "heartbeat_ack", "sent": message["sent"]}))
+        elif message_type == "question_closed":
+            if self.answered_at is not None:
+                self.stats.answer_to_score.append(time.monotonic() - self.answered_at)
+                self.answered_at = None
+        elif message_type == "end":
+            return True
+        return False
+
+    def spawn(self, coroutine):
+        task = asyncio.ensure_future(coroutine)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def send(self, message):
+        if self.jitter:
+            await asyncio.sleep(self.rng.uniform(0, self.jitter))
+        self.writer.write(encode_message(message))
+        await self.writer.drain()
+
+    async def answer(self, data):
+        delay = self.answer_delay()
+        if "deadline" in data:
+            # Like the real client, never answer after the deadline
+            delay = min(delay, max(0.0, data["deadline"] - time.time() - self.jitter))
+        await asyncio.sleep(delay)
+        if data["type"] == "multiple_choice":
+            answer = {"type": "multiple_choice", "answer": self.rng.randrange(len(data["options"]))}
+        else:
+            known = self.rng.random() < self.accuracy
+            answer = {"type": "short_answer", "answer": data.get("answer", "") if known else "no idea"}
+        self.answered_at = time.monotonic()
+        self.stats.answers += 1
+        await self.send(answer)
+
+
+async def run_bots(host, port, players, answer_time="normal:3,1", jitter=0.0,
+                   connect_concurrency=200, name_prefix="bot", seed=None, room=None):
+    """Join players bots, capping simultaneous connects, and wait until they all finish"""
+    stats = BotStats()
+    rng = random.Random(seed)
+    answer_delay = parse_distribution(answer_time, rng)
+    gate = asyncio.Semaphore(connect_concurrency)
+
+    async def run_one(number):
+        bot = LoadBot(f"{name_prefix}{number:05d}", host, port, stats, answer_delay,
+                      jitter=jitter, rng=random.Random(rng.random()), room=room)
+        async with gate:
+            # Hold a connect slot only until the handshake is done
+            joined = await bot.join()
+        if joined:
+            await bot.play()
+
+    await asyncio.gather(*(run_one(number) for number in range(players)))
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate many quiz players from one process")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--players", type=int, default=100)
+    parser.add_argument("--answer-time", default="normal:3,1",
+                        help="fixed:S, uniform:A,B, normal:MEAN,SD or exp:MEAN (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="up to this many seconds of random delay before each send")
+    parser.add_argument("--connect-concurrency", type=int, default=200)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--room", help="room code, for servers hosting several quizzes")
+    args = parser.parse_args(argv)
+
+    stats = asyncio.run(run_bots(args.host, args.port, args.players, args.answer_time,
+                                 args.jitter, args.connect_concurrency, seed=args.seed,
+                                 room=args.room))
+    summary = stats.summary()
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+# protocol.py
+import hashlib
+import json
+import struct
+import time
+import zlib
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    zstd = None
+
+PROTOCOL_VERSION = 1
+
+# Every frame starts with a fixed header: payload kind (1 byte) followed by
+# the payload length (4 bytes, network byte order)
+HEADER = struct.Struct("!BI")
+KIND_JSON = 1
+KIND_BINARY = 2
+KIND_ASSET = 3  # payload: raw sha256 digest of the data, then the data itself
+DIGEST_SIZE = 32
+MAX_FRAME_SIZE = 64 * 1024 * 1024  # 64 MB, large enough for any question image
+FLAG_COMPRESSED = 0x80  # set on the kind byte when the payload is compressed
+COMPRESSION_THRESHOLD = 512  # payloads smaller than this are always sent raw
+
+
+class ProtocolError(Exception):
+    """Raised when the peer sends a malformed or unexpected frame"""
+
+
+def _zlib_decompress(data):
+    decompressor = zlib.decompressobj()
+    result = decompressor.decompress(data, MAX_FRAME_SIZE)
+    if decompressor.unconsumed_tail:
+        raise ProtocolError("Compressed frame expands beyond the frame size limit")
+    return result
+
+
+def _zstd_decompress(data):
+    decompressor = zstd.ZstdDecompressor()
+    result = decompressor.decompress(data, MAX_FRAME_SIZE)
+    if not decompressor.eof:
+        raise ProtocolError("Compressed frame expands beyond the frame size limit")
+    return result
+
+
+# Codec name -> (compress, decompress), in server preference order
+CODECS = {}
+if zstd is not None:
+    CODECS["zstd"] = (lambda data: zstd.compress(data, 3), _zstd_decompress)
+CODECS["zlib"] = (lambda data: zlib.compress(data, 6), _zlib_decompress)
+
+
+def choose_codec(offered):
+    """Pick the first codec we prefer that the peer also offered, or None"""
+    offered = offered or []
+    for name in CODECS:
+        if name in offered:
+            return name
+    return None
+
+
+def encode_frame(kind, payload, codec=None):
+    """Prefix a payload with its frame header, compressing it if worthwhile"""
+    if codec and len(payload) >= COMPRESSION_THRESHOLD:
+        compressed = CODECS[codec][0](payload)
+        if len(compressed) < len(payload):
+            kind |= FLAG_COMPRESSED
+            payload = compressed
+    if len(payload) > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame too large: {len(payload)} bytes")
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def encode_message(message, codec=None):
+    """Encode a JSON-serializable message as a complete frame"""
+    payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+    return encode_frame(KIND_JSON, payload, codec)
+
+
+class OutboundMessage:
+    """
+    A message serialized once and shared read-only by every connection
+    that sends it. Connections report what they actually wrote, so a
+    broadcast can compare bytes serialized with bytes sent.
+    """
+
+    def __init__(self, message, on_complete=None):
+        self.type = message.get("type")
+        self.payload = json.dumps(message, separators=(",", ":")).encode("utf-8")
+        self.frames = {}  # codec -> frame, each built at most once
+        self.frame = self.frame_for(None)
+        self.serialized_bytes = len(self.frame)
+        self.sent_bytes = 0
+        self.recipients = 0
+        self.dropped = 0
+        self.pending = 0
+        self.sealed = False  # set by seal() once every copy is queued
+        self.on_complete = on_complete  # callable(message) once every copy is written or dropped
+        self.created_at = time.monotonic()
+
+    def __len__(self):
+        return self.serialized_bytes
+
+    def frame_for(self, codec):
+        """Frame for a connection's negotiated codec, compressed once and shared"""
+        frame = self.frames.get(codec)
+        if frame is None:
+            frame = memoryview(encode_frame(KIND_JSON, self.payload, codec)).toreadonly()
+            self.frames[codec] = frame
+        return frame
+
+    def queued(self):
+        self.pending += 1
+
+    def seal(self):
+        """No more copies will be queued: completion may fire from now on"""
+        self.sealed = True
+        self._complete()
+
+    def record_sent(self, sent_bytes):
+        self.sent_bytes += sent_bytes
+        self.recipients += 1
+        self._settle()
+
+    def record_dropped(self):
+        self.dropped += 1
+        self._settle()
+
+    def _settle(self):
+        self.pending -= 1
+        self._complete()
+
+    def _complete(self):
+        # Copies can be written or dropped while the fan-out is still queueing others
+        if self.sealed and self.pending == 0 and self.on_complete:
+            on_complete, self.on_complete = self.on_complete, None
+            on_complete(self)
+
+
+def asset_hash(data):
+    """Content address of an asset (hex sha256)"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def encode_asset(digest, data):
+    """Encode asset bytes as a frame tagged with their content hash"""
+    return encode_frame(KIND_ASSET, bytes.fromhex(digest) + data)
+
+
+def decode_payload(kind, payload, codec=None):
+    """Turn a frame payload back into a message dict (or raw bytes)"""
+    if kind & FLAG_COMPRESSED:
+        if codec not in CODECS:
+            raise ProtocolError("Compressed frame without a negotiated codec")
+        kind &= ~FLAG_COMPRESSED
+        payload = CODECS[codec][1](payload)
+    if kind == KIND_JSON:
+        try:
+            return json.loads(str(payload, "utf-8"))
+        except ValueError as e:
+            raise ProtocolError(f"Invalid JSON payload: {e}")
+    if kind == KIND_BINARY:
+        return bytes(payload)
+    if kind == KIND_ASSET:
+        if len(payload) < DIGEST_SIZE:
+            raise ProtocolError("Truncated asset frame")
+        return {
+            "type": "asset",
+            "hash": bytes(payload[:DIGEST_SIZE]).hex(),
+            "data": bytes(payload[DIGEST_SIZE:])
+        }
+    raise ProtocolError(f"Unknown frame kind: {kind}")
+
+
+def send_message(sock, message):
+    """Send a single message over a blocking socket"""
+    sock.sendall(encode_message(message))
+
+
+class FrameReader:
+    """
+    Read length-prefixed frames from a blocking socket.
+
+    Payloads are received with recv_into into a preallocated buffer, so a
+    large image message is read in one linear pass and two messages that
+    arrive in the same TCP segment are never merged.
+    """
+
+    def __init__(self, sock, buffer_size=64 * 1024, codec=None):
+        self.sock = sock
+        self.codec = codec  # set once the handshake negotiated compression
+        self.header = bytearray(HEADER.size)
+        self.buffer = bytearray(buffer_size)
+
+    def _recv_exact(self, view):
+        """Fill the whole view from the socket or raise ConnectionError"""
+        received = 0
+        while received < len(view):
+            count = self.sock.recv_into(view[received:])
+            if count == 0:
+                raise ConnectionError("Connection closed by peer")
+            received += count
+
+    def read_frame(self):
+        """Read one frame and return (kind, payload)"""
+        self._recv_exact(memoryview(self.header))
+        kind, length = HEADER.unpack(self.header)
+        if length > MAX_FRAME_SIZE:
+            raise ProtocolError(f"Frame too large: {length} bytes")
+
+        # Grow the buffer only when a bigger frame arrives
+        if length > len(self.buffer):
+            size = len(self.buffer)
+            while size < length:
+                size *= 2
+            self.buffer = bytearray(size)
+
+        view = memoryview(self.buffer)[:length]
+        self._recv_exact(view)
+        return kind, view
+
+    def read_message(self):
+        """Read and decode the next message"""
+        kind, payload = self.read_frame()
+        return decode_payload(kind, payload, self.codec)
+
+
+async def read_message_async(stream, codec=None):
+    """Read and decode the next message from an asyncio StreamReader"""
+    header = await stream.readexactly(HEADER.size)
+    kind, length = HEADER.unpack(header)
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError(f"Frame too large: {length} bytes")
+    payload = await stream.readexactly(length)
+    return decode_payload(kind, payload, codec)
+
+
+CHANNEL_GAME = "game"
+CHANNEL_ASSETS = "assets"  # side connection used only to download images
+
+
+def make_hello(player_name, channel=CHANNEL_GAME, session=None, room=None):
+    """Build the first message a client sends after connecting"""
+    hello = {
+        "type": "hello",
+        "version": PROTOCOL_VERSION,
+        "name": player_name,
+        "channel": channel,
+        "compression": list(CODECS)
+    }
+    if session:
+        hello["session"] = session  # resume a dropped connection
+    if room:
+        hello["room"] = room  # game to join on a server hosting several
+    return hello
+
+
+def check_hello(message):
+    """
+    Validate a client hello and return the player name.
+    Raises ProtocolError if the handshake is not acceptable.
+    """
+    if not isinstance(message, dict) or message.get("type") != "hello":
+        raise ProtocolError("Expected hello message")
+    if message.get("version") != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version: {message.get('version')} "
+                            f"(server speaks {PROTOCOL_VERSION})")
+    player_name = str(message.get("name") or "").strip()
+    if not player_name:
+        raise ProtocolError("Player name is required")
+    return player_name
+
+
+def hello_room(message):
+    """Normalized room code from a hello, or None if it names no room"""
+    room = str(message.get("room") or "").strip().upper()
+    return room or None
+
+
+def make_welcome(codec=None, session=None, resumed=False):
+    """
+    Server reply accepting a hello, with the codec chosen for this connection.
+    session is the token to present when reconnecting; resumed tells the
+    client its score and answers were kept.
+    """
+    return {"type": "welcome", "version": PROTOCOL_VERSION, "compression": codec,
+            "session": session, "resumed": resumed}
+
+
+def make_rejected(reason):
+    """Server reply refusing a hello"""
+    return {"type": "rejected", "reason": reason}
+
+
+def check_welcome(reply):
+    """
+    Validate the server's handshake reply and return the negotiated codec.
+    Raises ProtocolError if the server refused or answered nonsense.
+    """
+    if not isinstance(reply, dict):
+        raise ProtocolError("Unexpected handshake reply")
+    if reply.get("type") == "rejected":
+        raise ProtocolError(reply.get("reason", "Rejected by server"))
+    if reply.get("type") != "welcome":
+        raise ProtocolError(f"Unexpected handshake reply: {reply.get('type')}")
+    codec = reply.get("compression")
+    if codec is not None and codec not in CODECS:
+        raise ProtocolError(f"Server chose unsupported compression: {codec}")
+    return codec
+
+
+def client_handshake(sock, player_name, channel=CHANNEL_GAME, session=None, room=None):
+    """
+    Perform the join handshake from the client side.
+    Returns the FrameReader to use for the rest of the connection, with
+    the session token and whether it was resumed attached.
+    """
+    send_message(sock, make_hello(player_name, channel, session, room))
+    reader = FrameReader(sock)
+    reply = reader.read_message()
+    reader.codec = check_welcome(reply)
+    reader.session = reply.get("session")
+    reader.resumed = bool(reply.get("resumed"))
+    return reader
+
+
+async def client_handshake_async(stream, writer, player_name, channel=CHANNEL_GAME, session=None,
+                                 room=None):
+    """Join handshake over asyncio streams; returns the validated welcome message"""
+    writer.write(encode_message(make_hello(player_name, channel, session, room)))
+    await writer.drain()
+    reply = await read_message_async(stream)
+    check_welcome(reply)
+    return reply
@@ -0,0 +1,175 @@
+# answer_export.py
+import asyncio
+import csv
+import os
+import threading
+import time
+from datetime import datetime
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+DEFAULT_EXPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "answers")
+EXPORT_FLUSH_INTERVAL = 2.0  # seconds between batch writes during the game
+ANSWER_COLUMNS = ("question_number", "question_type", "player", "answer",
+                  "latency_seconds", "correct", "points", "answered_at")
+# Nullable dtypes keep every Parquet part on the same schema, even a part
+# holding nothing but ungraded answers
+ANSWER_DTYPES = {
+    "question_number": "int64",
+    "question_type": "string",
+    "player": "string",
+    "answer": "string",
+    "latency_seconds": "float64",
+    "correct": "boolean",
+    "points": "Int64",
+    "answered_at": "float64"
+}
+
+
+def parquet_engine():
+    """Name of an installed Parquet engine for pandas, or None"""
+    if pd is None:
+        return None
+    for module in ("pyarrow", "fastparquet"):
+        try:
+            __import__(module)
+            return module
+        except ImportError:
+            continue
+    return None
+
+
+class AnswerExport:
+    """
+    Every scored answer of a quiz, written to disk while the game runs.
+
+    The ScoreKeeper hands over one row per answer once its correctness is
+    settled: multiple choice when the question closes, short answers when
+    graded. add() only buffers; run() writes a batch every flush_interval
+    on a worker thread, as numbered Parquet parts when pandas has a Parquet
+    engine and as one appended CSV file otherwise. Each quiz gets its own
+    folder. When the quiz ends, finish() writes the last rows and the
+    per-question statistics, computed with pandas over the whole table.
+    """
+
+    def __init__(self, directory=DEFAULT_EXPORT_DIR, flush_interval=EXPORT_FLUSH_INTERVAL,
+                 metrics=None):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.metrics = metrics
+        self.engine = parquet_engine()
+        self.folder = None  # current quiz's folder, None before the first quiz
+        self.rows = []
+        self.parts = 0
+        self.lock = threading.Lock()  # batch and final writes may overlap on worker threads
+
+    def begin(self):
+        """Start a new quiz's folder; rows of an unfinished previous quiz are written first"""
+        if self.rows and self.folder:
+            self.write_batch(*self.take())
+        # Microseconds, plus a counter for clocks too coarse for them: a quiz
+        # restarted or recovered right away must not write over the last one
+        base = os.path.join(self.directory, f"quiz_{datetime.now():%Y%m%d_%H%M%S_%f}")
+        folder, attempt = base, 1
+        while os.path.exists(folder) or folder == self.folder:
+            attempt += 1
+            folder = f"{base}_{attempt}"
+        self.folder = folder
+        self.parts = 0
+
+    def add(self, row):
+        if self.folder is not None:
+            self.rows.append(row)
+
+    def take(self):
+        rows, self.rows = self.rows, []
+        self.parts += 1
+        return self.folder, self.parts, rows
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.rows:
+                await loop.run_in_executor(None, self.write_batch, *self.take())
+
+    async def finish(self):
+        """Write the quiz's last rows and its statistics"""
+        if self.folder is None:
+            return
+        job = self.take()
+        self.folder = None  # answers graded after the end are not part of this quiz
+        await asyncio.get_running_loop().run_in_executor(None, self.complete, *job)
+
+    def write_batch(self, folder, part, rows):
+        if not rows:
+            return
+        started = time.perf_counter()
+        with self.lock:
+            if self.engine:
+                answers_dir = os.path.join(folder, "answers")
+                os.makedirs(answers_dir, exist_ok=True)
+                frame = pd.DataFrame(rows, columns=ANSWER_COLUMNS).astype(ANSWER_DTYPES)
+                frame.to_parquet(os.path.join(answers_dir, f"part-{part:05d}.parquet"),
+                                 engine=self.engine, index=False)
+            else:
+                os.makedirs(folder, exist_ok=True)
+                path = os.path.join(folder, "answers.csv")
+                new_file = not os.path.exists(path)
+                with open(path, "a", newline="", encoding="utf-8") as f:
+                    writer = csv.DictWriter(f, fieldnames=ANSWER_COLUMNS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerows(rows)
+        if self.metrics:
+            self.metrics.observe("export_batch_seconds", time.perf_counter() - started)
+            self.metrics.inc("answers_exported", len(rows))
+
+    def complete(self, folder, part, rows):
+        self.write_batch(folder, part, rows)
+        try:
+            self.write_statistics(folder)
+        except Exception as e:
+            print(f"Could not compute answer statistics: {e}")
+
+    def read_answers(self, folder):
+        if self.engine:
+            return pd.read_parquet(os.path.join(folder, "answers"), engine=self.engine)
+        return pd.read_csv(os.path.join(folder, "answers.csv")).astype(ANSWER_DTYPES)
+
+    def write_statistics(self, folder):
+        """Per-question answer distribution, timing and difficulty"""
+        if pd is None:
+            print("pandas is not installed: skipping per-question statistics")
+            return
+        if not os.path.exists(os.path.join(folder, "answers" if self.engine else "answers.csv")):
+            return  # nobody answered anything
+        answers = self.read_answers(folder)
+        by_question = answers.groupby("question_number")
+        stats = by_question.agg(
+            question_type=("question_type", "first"),
+            answers=("player", "size"),
+            graded=("correct", "count"),
+            correct=("correct", "sum"),
+            mean_latency=("latency_seconds", "mean"),
+            median_latency=("latency_seconds", "median"),
+            mean_points=("points", "mean"))
+        stats["correct_rate"] = stats["correct"] / stats["graded"]
+        # Share of graded answers that were wrong: 0 is trivial, 1 stumped everyone
+        stats["difficulty"] = 1 - stats["correct_rate"]
+
+        distribution = (answers.groupby(["question_number", "answer"]).size()
+                        .rename("count").reset_index())
+        distribution["share"] = (distribution["count"] /
+                                 distribution.groupby("question_number")["count"].transform("sum"))
+
+        if self.engine:
+            stats.to_parquet(os.path.join(folder, "question_stats.parquet"), engine=self.engine)
+            distribution.to_parquet(os.path.join(folder, "answer_distribution.parquet"),
+                                    engine=self.engine, index=False)
+        else:
+            stats.to_csv(os.path.join(folder, "question_stats.csv"))
+            distribution.to_csv(os.path.join(folder, "answer_distribution.csv"), index=False)
+        print(f"Answers and statistics for {len(stats)} questions written to {folder}")
@@ -0,0 +1,121 @@
+# connection.py
+import asyncio
+import time
+from collections import deque
+
+MAX_QUEUED_MESSAGES = 256  # disconnect a player who falls this far behind
+BACKLOG_MESSAGES = 4  # beyond this many queued messages a player counts as backed up
+MAX_QUEUED_BYTES = 16 * 1024 * 1024
+SEND_TIMEOUT = 15  # seconds one write may take to drain before giving up
+RTT_SMOOTHING = 0.125  # weight of a new round-trip sample, as in TCP's SRTT
+
+
+class ClientConnection:
+    """
+    One player's socket with its own bounded outbound queue.
+
+    Broadcasts only append a shared OutboundMessage to the queue; a
+    per-connection writer task drains it, so a player on a slow link
+    delays nobody but themselves.
+    Score updates are droppable: while the queue is backed up, new score
+    updates are discarded and the player gets one fresh snapshot once it
+    catches up. A player who stays too far behind is disconnected.
+    """
+
+    gateway = None  # players relayed by a gateway process are RemotePlayers instead
+
+    def __init__(self, name, writer, codec=None, resync=None,
+                 max_messages=MAX_QUEUED_MESSAGES, max_bytes=MAX_QUEUED_BYTES,
+                 send_timeout=SEND_TIMEOUT, metrics=None):
+        self.name = name
+        self.metrics = metrics
+        self.writer = writer
+        self.codec = codec  # compression negotiated at handshake, None for raw frames
+        self.resync = resync  # callable(connection) that queues a fresh score snapshot
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.send_timeout = send_timeout
+        self.queue = deque()
+        self.queued_bytes = 0
+        self.scores_stale = False
+        self.last_seen = time.monotonic()  # last time anything arrived from the player
+        self.rtt = None  # smoothed heartbeat round trip in seconds
+        self.closed = False
+        self.wakeup = asyncio.Event()
+        self.task = asyncio.ensure_future(self.drain_queue())
+
+    def send(self, message, droppable=False):
+        """Queue an OutboundMessage; never blocks"""
+        message.queued()
+        if self.closed:
+            message.record_dropped()
+            return
+        if droppable and len(self.queue) >= BACKLOG_MESSAGES:
+            # Backed up: skip this update, a snapshot follows when the queue empties
+            self.scores_stale = True
+            message.record_dropped()
+            if self.metrics:
+                self.metrics.inc("messages_dropped")
+            return
+        if len(self.queue) >= self.max_messages or self.queued_bytes + len(message) > self.max_bytes:
+            print(f"Disconnecting slow client {self.name}: "
+                  f"{len(self.queue)} messages / {self.queued_bytes} bytes queued")
+            message.record_dropped()
+            if self.metrics:
+                self.metrics.inc("slow_client_disconnects")
+            self.close(abort=True)
+            return
+        self.queue.append(message)
+        self.queued_bytes += len(message)
+        self.wakeup.set()
+
+    def record_rtt(self, sample):
+        if self.rtt is None:
+            self.rtt = sample
+        else:
+            self.rtt += RTT_SMOOTHING * (sample - self.rtt)
+
+    async def drain_queue(self):
+        try:
+            while not self.closed:
+                if not self.queue:
+                    if self.scores_stale and self.resync:
+                        self.scores_stale = False
+                        self.resync(self)
+                        continue
+                    self.wakeup.clear()
+                    await self.wakeup.wait()
+                    continue
+                message = self.queue.popleft()
+                self.queued_bytes -= len(message)
+                # The shared frame is written as is, never copied per player
+                frame = message.frame_for(self.codec)
+                self.writer.write(frame)
+                message.record_sent(len(frame))
+                if self.metrics:
+                    self.metrics.inc(f"bytes_out.{message.type}", len(frame))
+                    self.metrics.inc(f"messages_out.{message.type}")
+                await asyncio.wait_for(self.writer.drain(), self.send_timeout)
+        except (asyncio.TimeoutError, OSError) as e:
+            print(f"Send to {self.name} failed: {e!r}")
+            self.close(abort=True)
+        finally:
+            self.close()
+
+    def close(self, abort=False):
+        """
+        Drop queued data and close the socket; the reader task then cleans up.
+        abort skips flushing the transport buffer, for peers that stopped reading.
+        """
+        if self.closed:
+            return
+        self.closed = True
+        for message in self.queue:
+            message.record_dropped()
+        self.queue.clear()
+        self.queued_bytes = 0
+        self.wakeup.set()
+        if abort:
+            self.writer.transport.abort()
+        else:
+            self.writer.close()
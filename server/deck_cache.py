@@ -0,0 +1,206 @@
+# deck_cache.py
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+
+DECK_MAGIC = b"MKDECK01"
+DECK_HEADER = struct.Struct("!Q")  # length of the JSON header that follows the magic
+DECK_VERSION = 1
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "deck_cache")
+BLOB_FIELDS = ("image", "thumbnail")
+
+
+def file_sha256(path):
+    """Hash a file in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_stamp(path):
+    """(size, mtime_ns) of a file, or None if it is gone"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+class DeckCache:
+    """
+    Compiled question decks.
+
+    A deck is one file holding the normalized questions as a JSON header
+    followed by the prepared image blobs. Each workbook path has one deck
+    file, rebuilt when the workbook's content, its images or the importer's
+    image settings changed. An unchanged workbook is recognized by size and
+    mtime without being read at all; a touched one by its content hash.
+    Opening a deck is a memory-mapped read: image fields become memoryview
+    slices of the map instead of copies.
+
+    The last loaded deck is also kept in memory, so rooms playing the same
+    workbook share one question list and one map of images. The maps of
+    decks it replaced are closed once no question refers to them anymore.
+    """
+
+    def __init__(self, importer, directory=DEFAULT_CACHE_DIR):
+        self.importer = importer
+        self.directory = directory
+        self.open_maps = {}  # deck path -> map its questions' images point into
+        self.retired_maps = []  # maps of replaced decks, closed once nothing uses them
+        self.loaded = {}  # deck path -> (workbook stamp, questions) already opened
+        self.lock = threading.Lock()  # rooms may load decks from several threads
+
+    def deck_path(self, file_path):
+        name = hashlib.sha256(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.directory, f"{name}.deck")
+
+    def load(self, file_path, workers=None):
+        """Return questions for a workbook, rebuilding the deck only when stale"""
+        deck_path = self.deck_path(file_path)
+        stamp = file_stamp(file_path)
+        with self.lock:
+            loaded = self.loaded.get(deck_path)
+            if loaded is not None and stamp is not None and loaded[0] == stamp:
+                return loaded[1]
+            questions = self.load_deck(deck_path, file_path, workers)
+            self.loaded = {deck_path: (stamp, questions)}
+            for path in list(self.open_maps):
+                if path != deck_path:
+                    self.retired_maps.append(self.open_maps.pop(path))
+            self.close_retired()
+            return questions
+
+    def close_retired(self):
+        """Close the maps of replaced decks whose questions are all gone"""
+        still_used = []
+        for deck_map in self.retired_maps:
+            try:
+                deck_map.close()
+            except BufferError:
+                still_used.append(deck_map)  # an engine still holds its images; retry next load
+        self.retired_maps = still_used
+
+    def load_deck(self, deck_path, file_path, workers):
+        questions = self.open_deck(deck_path, file_path)
+        if questions is not None:
+            return questions
+
+        questions = self.importer.load_questions(file_path, workers)
+        try:
+            self.write_deck(deck_path, file_path, questions)
+        except OSError as e:
+            print(f"Could not write compiled deck: {e}")
+            return questions
+        return self.open_deck(deck_path, file_path) or questions
+
+    def read_header(self, deck_map):
+        if deck_map[:len(DECK_MAGIC)] != DECK_MAGIC:
+            return None, 0
+        start = len(DECK_MAGIC) + DECK_HEADER.size
+        (header_length,) = DECK_HEADER.unpack_from(deck_map, len(DECK_MAGIC))
+        header = json.loads(deck_map[start:start + header_length])
+        return header, start + header_length
+
+    def is_current(self, header, file_path):
+        """Check a deck header against the workbook and image files on disk"""
+        if header.get("version") != DECK_VERSION:
+            return False
+        if header.get("settings") != json.loads(json.dumps(self.importer.image_settings())):
+            return False
+        for image_path, stamp in header.get("images", {}).items():
+            if file_stamp(image_path) != stamp:
+                return False
+
+        source = header.get("source", {})
+        stamp = file_stamp(file_path)
+        if stamp is None:
+            return False
+        if stamp == source.get("stamp"):
+            return True
+        # Touched but maybe not modified: fall back to the content hash
+        return file_sha256(file_path) == source.get("sha256")
+
+    def open_deck(self, deck_path, file_path):
+        """Map a deck file and rebuild its questions, or None if missing/stale"""
+        try:
+            with open(deck_path, "rb") as f:
+                deck_map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return None
+
+        try:
+            header, blob_start = self.read_header(deck_map)
+            if header is None or not self.is_current(header, file_path):
+                deck_map.close()
+                return None
+        except (ValueError, struct.error) as e:
+            print(f"Ignoring corrupt deck {deck_path}: {e}")
+            deck_map.close()
+            return None
+
+        view = memoryview(deck_map)
+        questions = []
+        for stored in header["questions"]:
+            question = dict(stored)
+            for field in BLOB_FIELDS:
+                if question.get(field):
+                    offset, length = question[field]
+                    question[field] = view[blob_start + offset:blob_start + offset + length]
+            questions.append(question)
+        previous = self.open_maps.pop(deck_path, None)
+        if previous is not None:
+            self.retired_maps.append(previous)
+        self.open_maps[deck_path] = deck_map
+        return questions
+
+    def write_deck(self, deck_path, file_path, questions):
+        """Serialize questions and their image blobs into a deck file"""
+        blobs = []
+        blob_offsets = {}  # identical images are stored once
+        offset = 0
+        stored_questions = []
+        images = {}
+        for question in questions:
+            stored = dict(question)
+            for field in BLOB_FIELDS:
+                data = question.get(field)
+                if data:
+                    data = bytes(data)
+                    if data not in blob_offsets:
+                        blob_offsets[data] = offset
+                        blobs.append(data)
+                        offset += len(data)
+                    stored[field] = [blob_offsets[data], len(data)]
+                else:
+                    stored[field] = None
+            if question.get("image_source"):
+                images[question["image_source"]] = file_stamp(question["image_source"])
+            stored_questions.append(stored)
+
+        header = json.dumps({
+            "version": DECK_VERSION,
+            "source": {
+                "path": os.path.abspath(file_path),
+                "stamp": file_stamp(file_path),
+                "sha256": file_sha256(file_path)
+            },
+            "settings": self.importer.image_settings(),
+            "images": images,
+            "questions": stored_questions
+        }, separators=(",", ":")).encode("utf-8")
+
+        os.makedirs(self.directory, exist_ok=True)
+        temp_path = deck_path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(DECK_MAGIC)
+            f.write(DECK_HEADER.pack(len(header)))
+            f.write(header)
+            for data in blobs:
+                f.write(data)
+        os.replace(temp_path, deck_path)
@@ -0,0 +1,148 @@
+# event_log.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+
+LOG_BATCH_INTERVAL = 0.05  # seconds of appends gathered into one write and fsync
+SNAPSHOT_EVERY = 5000  # records after which the log is compacted into a snapshot
+DECK_FIELDS = ("question", "type", "options", "correct", "answer")
+
+
+def deck_fingerprint(questions):
+    """Identify a deck by its questions and answers, ignoring images"""
+    digest = hashlib.sha256()
+    for question in questions:
+        fields = {field: question.get(field) for field in DECK_FIELDS}
+        digest.update(json.dumps(fields, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class EventLog:
+    """
+    Append-only write-ahead log of a quiz's state changes, with snapshots.
+
+    Records are JSON arrays, one per line: [kind, *args]. append() only
+    buffers; the run() task writes the buffer and fsyncs it every
+    batch_interval on a worker thread, so a burst of answers costs one
+    fsync, and a crash loses at most the last interval.
+
+    Once snapshot_every records piled up, run() asks for the complete state,
+    writes it atomically next to the log and empties the log, so recovery
+    reads one snapshot and a short tail no matter how long the quiz ran.
+    """
+
+    def __init__(self, path, batch_interval=LOG_BATCH_INTERVAL, snapshot_every=SNAPSHOT_EVERY,
+                 metrics=None):
+        self.path = path
+        self.snapshot_path = path + ".snapshot"
+        self.batch_interval = batch_interval
+        self.snapshot_every = snapshot_every
+        self.metrics = metrics
+        self.buffer = []
+        self.records_since_snapshot = 0
+        self.generation = 0  # bumped by reset(), so writes already in flight are dropped
+        self.lock = threading.Lock()  # file access from the loop and the fsync thread
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.file = open(path, "ab")
+
+    def append(self, kind, *args):
+        self.buffer.append(json.dumps([kind, *args], separators=(",", ":")).encode("utf-8") + b"\n")
+        self.records_since_snapshot += 1
+
+    def load(self):
+        """Return (snapshot state or None, records logged after it)"""
+        snapshot = None
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            print(f"Ignoring unreadable snapshot {self.snapshot_path}: {e}")
+        records = []
+        with open(self.path, "rb") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # A write torn by the crash can only be the last line
+                    print(f"Ignoring a torn record at the end of {self.path}")
+                    break
+        return snapshot, records
+
+    async def run(self, snapshot_state):
+        """Group-commit appends; snapshot_state() returns the state to compact into"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.batch_interval)
+            if self.records_since_snapshot >= self.snapshot_every:
+                # The state already includes every buffered record, so they can go;
+                # serialized here, before the game moves on, not on the worker thread
+                state = json.dumps(snapshot_state(), separators=(",", ":"))
+                self.buffer = []
+                self.records_since_snapshot = 0
+                await loop.run_in_executor(None, self.write_snapshot, state, self.generation)
+            elif self.buffer:
+                data, self.buffer = b"".join(self.buffer), []
+                await loop.run_in_executor(None, self.write, data, self.generation)
+
+    def write(self, data, generation=None):
+        started = time.perf_counter()
+        with self.lock:
+            if self.file.closed or (generation is not None and generation != self.generation):
+                return
+            self.file.write(data)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        if self.metrics:
+            self.metrics.observe("log_fsync_seconds", time.perf_counter() - started)
+            self.metrics.inc("log_bytes", len(data))
+
+    def write_snapshot(self, state, generation):
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(state)
+            f.flush()
+            os.fsync(f.fileno())
+        with self.lock:
+            if self.file.closed or generation != self.generation:
+                os.remove(temp_path)
+                return
+            os.replace(temp_path, self.snapshot_path)
+            # Only once the snapshot is durable may the records it covers go
+            self.file.truncate(0)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+        if self.metrics:
+            self.metrics.inc("log_snapshots")
+
+    def reset(self):
+        """Forget everything logged so far, for a new quiz"""
+        self.buffer = []
+        self.records_since_snapshot = 0
+        with self.lock:
+            self.generation += 1
+            self.file.truncate(0)
+            self.file.flush()
+            try:
+                os.remove(self.snapshot_path)
+            except FileNotFoundError:
+                pass
+
+    def compact(self, state):
+        """Start over from state right away, as if run() had just snapshotted it"""
+        self.reset()
+        self.write_snapshot(json.dumps(state, separators=(",", ":")), self.generation)
+
+    def close(self):
+        """Write out whatever is still buffered"""
+        if self.buffer:
+            data, self.buffer = b"".join(self.buffer), []
+            self.write(data)
+        with self.lock:
+            if not self.file.closed:
+                self.file.close()
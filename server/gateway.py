@@ -0,0 +1,340 @@
+# gateway.py
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import (CHANNEL_ASSETS, OutboundMessage, ProtocolError, choose_codec,
+                      encode_asset, encode_message, make_rejected, make_welcome,
+                      read_message_async)
+from connection import ClientConnection
+from metrics import Metrics
+from quiz_engine import HANDSHAKE_TIMEOUT, HEARTBEAT_INTERVAL, HEARTBEAT_TIMEOUT, read_hello
+
+LINK_CONNECT_TIMEOUT = 10  # seconds a new gateway keeps trying to reach the engine
+COUNTER_INTERVAL = 1  # seconds between counter updates sent to the engine
+
+
+class Gateway:
+    """
+    A worker process terminating player connections for a central engine.
+
+    Several gateways listen on the same port with SO_REUSEPORT, so the
+    kernel spreads new players across them and one quiz can use every core
+    of the host. A gateway does the handshake, compression, heartbeats and
+    send queues for its own players and relays their answers to the engine
+    (see GatewayLink) over a local socket. Broadcasts arrive once per
+    gateway and are fanned out here; images are mirrored from the engine
+    so the asset channel never reaches it. The counters of its connections
+    (bytes and messages out, drops) are added to the engine's metrics.
+    """
+
+    def __init__(self, engine_path, host='0.0.0.0', port=5000, backlog=1024,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT):
+        self.engine_path = engine_path
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.link_reader = None
+        self.link_writer = None
+        self.server = None
+        self.connections = {}  # connection id -> ClientConnection of an admitted player
+        self.pending = {}  # connection id -> (name, writer, codec, future) awaiting the engine
+        self.conn_ids = itertools.count(1)
+        self.open_writers = set()
+        self.connection_tasks = set()  # handler tasks of player sockets, awaited at shutdown
+        self.assets = {}  # image hash -> image bytes, mirrored from the engine
+        self.metrics = Metrics()  # counters only, handed on to the engine
+
+    async def run(self, ready=None):
+        """Serve players until the engine closes the link; sets ready once listening"""
+        await self.connect_engine()
+        self.server = await asyncio.start_server(
+            self.handle_connection, self.host, self.port,
+            backlog=self.backlog, reuse_port=True)
+        print(f"Gateway {os.getpid()} listening on {self.host}:{self.port}")
+        if ready is not None:
+            ready.set()
+        heartbeats = asyncio.ensure_future(self.send_heartbeats())
+        counters = asyncio.ensure_future(self.send_counters())
+        try:
+            await self.read_engine()
+        finally:
+            heartbeats.cancel()
+            counters.cancel()
+            await self.shutdown()
+        print(f"Gateway {os.getpid()} stopping: engine went away")
+
+    async def shutdown(self):
+        """Hang up on every player and let their handlers finish before the loop goes away"""
+        self.server.close()
+        self.link_writer.close()
+        for _, writer, _, future in self.pending.values():
+            if not future.done():
+                future.set_result(None)
+            writer.close()
+        self.pending.clear()
+        tasks = set(self.connection_tasks)
+        for connection in list(self.connections.values()):
+            tasks.add(connection.task)
+            connection.close(abort=True)
+        for writer in self.open_writers:
+            writer.transport.abort()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def connect_engine(self):
+        # Gateways may start before the engine has its socket up
+        deadline = time.monotonic() + LINK_CONNECT_TIMEOUT
+        while True:
+            try:
+                self.link_reader, self.link_writer = await asyncio.open_unix_connection(self.engine_path)
+                return
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+    def to_engine(self, envelope):
+        if not self.link_writer.is_closing():
+            self.link_writer.write(encode_message(envelope))
+
+    def forward(self, conn, message, received=None):
+        """Relay a player's message, stamped with its arrival time here"""
+        self.to_engine({"op": "message", "conn": conn, "message": message,
+                        "received": received or time.monotonic()})
+
+    # ---- Engine side ------------------------------------------------------
+
+    async def read_engine(self):
+        try:
+            while True:
+                envelope = await read_message_async(self.link_reader)
+                if isinstance(envelope, dict):
+                    self.handle_engine(envelope)
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+
+    def handle_engine(self, envelope):
+        op = envelope.get("op")
+        conn = envelope.get("conn")
+        if op == "broadcast":
+            # Serialized and compressed once here, shared by all of this gateway's players
+            outbound = OutboundMessage(envelope["message"])
+            for connection in self.connections.values():
+                connection.send(outbound, envelope.get("droppable", False))
+        elif op == "send":
+            connection = self.connections.get(conn)
+            if connection is not None:
+                connection.send(OutboundMessage(envelope["message"]), envelope.get("droppable", False))
+        elif op == "welcome":
+            self.admitted(conn, envelope.get("session"), envelope.get("resumed", False))
+        elif op == "rejected":
+            pending = self.pending.pop(conn, None)
+            if pending is not None:
+                _, writer, _, future = pending
+                writer.write(encode_message(make_rejected(envelope.get("reason", "Rejected"))))
+                writer.close()
+                future.set_result(None)
+        elif op == "close":
+            connection = self.connections.get(conn)
+            if connection is not None:
+                connection.close(abort=envelope.get("abort", False))
+        elif op == "assets":
+            self.assets = {}  # a new deck: the image frames that follow replace the old ones
+        elif envelope.get("type") == "asset":
+            self.assets[envelope["hash"]] = envelope["data"]
+
+    def admitted(self, conn, session, resumed):
+        """The engine seated a player: welcome them before any message for them is relayed"""
+        pending = self.pending.pop(conn, None)
+        if pending is None:
+            # The player gave up on the handshake meanwhile
+            self.to_engine({"op": "left", "conn": conn})
+            return
+        player_name, writer, codec, future = pending
+        writer.write(encode_message(make_welcome(codec, session, resumed)))
+        connection = ClientConnection(
+            player_name, writer, codec=codec,
+            resync=lambda _: self.forward(conn, {"type": "resync"}), metrics=self.metrics)
+        self.connections[conn] = connection
+        future.set_result(connection)
+
+    # ---- Player side ------------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connection_tasks.add(task)
+        self.open_writers.add(writer)
+        try:
+            hello, player_name = await read_hello(reader, writer)
+            if hello is None:
+                return
+            if hello.get("channel") == CHANNEL_ASSETS:
+                writer.write(encode_message(make_welcome()))
+                await self.serve_assets(player_name, reader, writer)
+            else:
+                await self.serve_player(hello, player_name, reader, writer)
+        finally:
+            self.open_writers.discard(writer)
+            self.connection_tasks.discard(task)
+
+    async def serve_player(self, hello, player_name, reader, writer):
+        conn = next(self.conn_ids)
+        codec = choose_codec(hello.get("compression"))
+        future = asyncio.get_running_loop().create_future()
+        self.pending[conn] = (player_name, writer, codec, future)
+        # Names and sessions are the engine's to check
+        self.to_engine({"op": "hello", "conn": conn, "player": player_name,
+                        "session": hello.get("session")})
+        try:
+            connection = await asyncio.wait_for(future, HANDSHAKE_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.pending.pop(conn, None)
+            writer.close()
+            return
+        if connection is None:
+            return  # rejected
+
+        try:
+            while True:
+                message = await read_message_async(reader, codec)
+                received = time.monotonic()
+                connection.last_seen = received
+                if not self.handle_locally(connection, message, received):
+                    self.forward(conn, message, received)
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+        finally:
+            del self.connections[conn]
+            self.to_engine({"op": "left", "conn": conn})
+            connection.close()
+
+    def handle_locally(self, connection, message, received):
+        """Answer connection upkeep here; returns False for messages the engine must see"""
+        message_type = message.get("type") if isinstance(message, dict) else None
+        if message_type == "heartbeat_ack":
+            sent = message.get("sent")
+            if isinstance(sent, (int, float)):
+                connection.record_rtt(received - sent)
+            return True
+        if message_type == "ping":
+            connection.send(OutboundMessage({
+                "type": "pong",
+                "client_time": message.get("client_time"),
+                "server_time": time.time()
+            }))
+            return True
+        return False
+
+    async def send_heartbeats(self):
+        """Same upkeep as the engine does for its own sockets"""
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            heartbeat = OutboundMessage({
+                "type": "heartbeat",
+                "sent": now,
+                "timeout": self.heartbeat_timeout
+            })
+            for connection in list(self.connections.values()):
+                if now - connection.last_seen > self.heartbeat_timeout:
+                    print(f"Evicting {connection.name}: silent for {now - connection.last_seen:.1f}s")
+                    self.metrics.inc("heartbeat_evictions")
+                    connection.close(abort=True)
+                else:
+                    connection.send(heartbeat)
+
+    async def send_counters(self):
+        """Add what this gateway's connections counted to the engine's metrics"""
+        while True:
+            await asyncio.sleep(COUNTER_INTERVAL)
+            counters = self.metrics.take_counters()
+            if counters:
+                self.to_engine({"op": "counters", "counters": counters})
+
+    async def serve_assets(self, player_name, reader, writer):
+        """The asset channel, served from the mirrored images"""
+        try:
+            while True:
+                request = await read_message_async(reader)
+                if not isinstance(request, dict):
+                    continue
+                if request.get("type") == "asset_ready":
+                    self.to_engine({"op": "asset_ready", "player": player_name,
+                                    "hash": request.get("hash")})
+                    continue
+                if request.get("type") != "get_asset":
+                    continue
+                digest = request.get("hash")
+                data = self.assets.get(digest)
+                if data is None:
+                    writer.write(encode_message({"type": "asset_missing", "hash": digest}))
+                else:
+                    writer.write(encode_asset(digest, data))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+        finally:
+            writer.close()
+
+
+def run_gateway(engine_path, host='0.0.0.0', port=5000, backlog=1024, ready=None):
+    """Process entry point"""
+    try:
+        asyncio.run(Gateway(engine_path, host, port, backlog).run(ready))
+    except KeyboardInterrupt:
+        pass
+
+
+def start_gateways(count, engine_path, host='0.0.0.0', port=5000, backlog=1024,
+                   timeout=LINK_CONNECT_TIMEOUT):
+    """
+    Spawn gateway processes and wait until they all listen. Each exits by
+    itself once the engine closes its socket.
+    """
+    # Spawn, not fork: the parent may already be running the engine's loop thread
+    context = multiprocessing.get_context("spawn")
+    processes = []
+    for _ in range(count):
+        ready = context.Event()
+        process = context.Process(target=run_gateway, args=(engine_path, host, port, backlog, ready))
+        process.daemon = True
+        process.start()
+        processes.append((process, ready))
+    for process, ready in processes:
+        if not ready.wait(timeout):
+            print(f"Gateway {process.pid} did not start listening in {timeout}s")
+    return [process for process, _ in processes]
+
+
+def stop_gateways(processes, timeout=5):
+    for process in processes:
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve players for an engine running with a gateway socket")
+    parser.add_argument("engine", help="the engine's gateway socket path")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="gateway processes sharing the port")
+    args = parser.parse_args(argv)
+
+    processes = start_gateways(args.workers, args.engine, args.host, args.port)
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        stop_gateways(processes, timeout=1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# gateway_link.py
+import asyncio
+import json
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import KIND_JSON, ProtocolError, encode_asset, encode_frame, encode_message, read_message_async
+
+
+def relay_frame(payload, **fields):
+    """
+    Wrap an already serialized player message in a link envelope without
+    decoding and re-encoding it: {**fields, "message": <payload>}.
+    """
+    head = json.dumps(fields, separators=(",", ":"))[:-1].encode("utf-8")
+    return encode_frame(KIND_JSON, head + b',"message":' + payload + b"}")
+
+
+class RemotePlayer:
+    """
+    The engine's stand-in for a player whose socket lives in a gateway.
+
+    Quacks like a ClientConnection for the engine: send() relays the
+    message over the gateway link and close() asks the gateway to hang up.
+    Queueing, compression, heartbeats and slow-client handling all happen
+    in the gateway, next to the socket.
+    """
+
+    queue = ()  # nothing is queued engine-side
+    queued_bytes = 0
+    codec = None
+
+    def __init__(self, name, gateway, conn):
+        self.name = name
+        self.gateway = gateway
+        self.conn = conn  # the gateway's id for this connection
+        self.last_seen = time.monotonic()
+        self.rtt = None
+        self.closed = False
+
+    def send(self, message, droppable=False):
+        if self.closed:
+            message.queued()
+            message.record_dropped()
+            return
+        # What reaches the player is counted by the gateway; this is link traffic
+        self.gateway.write(relay_frame(message.payload, op="send", conn=self.conn, droppable=droppable))
+
+    def close(self, abort=False):
+        if self.closed:
+            return
+        self.closed = True
+        self.gateway.write(encode_message({"op": "close", "conn": self.conn, "abort": abort}))
+
+
+class GatewayLink:
+    """
+    The engine's end of one gateway process's local socket.
+
+    A gateway forwards handshakes, answers and disconnects of its players;
+    the engine answers with admissions, per-player messages and broadcasts.
+    A broadcast crosses each link once, still as the engine's serialized
+    JSON, and the gateway compresses it and fans it out to its players.
+    The gateway also gets a copy of every image so it can serve the asset
+    channel itself, and reports its connections' counters every second.
+    """
+
+    def __init__(self, engine, reader, writer):
+        self.engine = engine
+        self.reader = reader
+        self.writer = writer
+        self.players = {}  # gateway connection id -> RemotePlayer
+
+    def write(self, frame):
+        self.writer.write(frame)
+        self.engine.metrics.inc("gateway_link_bytes_out", len(frame))
+        self.engine.metrics.inc("gateway_link_messages_out")
+
+    def send_assets(self):
+        """Replace the gateway's image table with the engine's current one"""
+        self.write(encode_message({"op": "assets"}))
+        for digest, data in self.engine.assets.items():
+            self.write(encode_asset(digest, data))
+
+    async def serve(self):
+        self.send_assets()
+        try:
+            while True:
+                envelope = await read_message_async(self.reader)
+                if isinstance(envelope, dict):
+                    self.handle(envelope)
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+        finally:
+            # The gateway died: its players drop as if their own sockets had
+            for player in list(self.players.values()):
+                player.closed = True
+                self.engine.remove_player(player)
+            self.players.clear()
+
+    def handle(self, envelope):
+        op = envelope.get("op")
+        conn = envelope.get("conn")
+        if op == "message":
+            player = self.players.get(conn)
+            if player is not None:
+                # Stamped by the gateway on arrival; CLOCK_MONOTONIC is shared by every process
+                received = envelope.get("received") or time.monotonic()
+                player.last_seen = received
+                self.engine.handle_client_message(player, envelope.get("message"), received)
+        elif op == "hello":
+            self.admit(conn, str(envelope.get("player")), envelope.get("session"))
+        elif op == "left":
+            player = self.players.pop(conn, None)
+            if player is not None:
+                player.closed = True
+                self.engine.remove_player(player)
+        elif op == "asset_ready":
+            self.engine.mark_asset_ready(envelope.get("player"), envelope.get("hash"))
+        elif op == "counters":
+            for name, amount in envelope.get("counters", {}).items():
+                self.engine.metrics.inc(name, amount)
+
+    def admit(self, conn, player_name, token):
+        try:
+            token, resumed = self.engine.admit(player_name, token)
+        except ProtocolError as e:
+            self.write(encode_message({"op": "rejected", "conn": conn, "reason": str(e)}))
+            return
+        # The welcome goes out before anything add_player sends the new player
+        self.write(encode_message({"op": "welcome", "conn": conn, "session": token, "resumed": resumed}))
+        player = RemotePlayer(player_name, self, conn)
+        self.players[conn] = player
+        self.engine.add_player(player, resumed)
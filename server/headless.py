@@ -0,0 +1,314 @@
+# headless.py
+import argparse
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from datetime import datetime
+from question_importer import QuestionImporter
+from deck_cache import DeckCache
+from quiz_engine import RECOVERY_GRACE, QuizEngine
+from room_server import RoomServer
+from gateway import start_gateways, stop_gateways
+from answer_export import DEFAULT_EXPORT_DIR
+
+DEFAULT_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+EVENT_POLL = 0.5  # seconds between lobby checks while no events arrive
+
+
+def normalize_answer(text):
+    return " ".join(str(text).split()).casefold()
+
+
+def room_path(path, room):
+    """Give each room its own file next to the one asked for"""
+    if not path or not room:
+        return path
+    root, extension = os.path.splitext(path)
+    return f"{root}_{room}{extension}"
+
+
+def room_codes(log_path, count, room_server):
+    """
+    Codes for count rooms. With a log they are kept in a file next to it, so
+    a rerun after a crash reopens the same rooms and each finds its own log.
+    """
+    codes_path = log_path + ".rooms" if log_path else None
+    codes = []
+    if codes_path and os.path.exists(codes_path):
+        with open(codes_path, encoding="utf-8") as f:
+            codes = json.load(f)[:count]
+        print(f"Reopening rooms {', '.join(codes)} from {codes_path}")
+    while len(codes) < count:
+        code = room_server.new_code()
+        if code not in codes:
+            codes.append(code)
+    if codes_path:
+        directory = os.path.dirname(os.path.abspath(codes_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = codes_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(codes, f)
+        os.replace(temp_path, codes_path)
+    return codes
+
+
+class HeadlessHost:
+    """
+    Run one quiz without a display: load a deck, wait in the lobby, then let
+    the engine's question timer drive the game and write the results to disk.
+
+    Plays the host's part of the Tk view from the engine event queue. Short
+    answers are graded automatically by comparing them, ignoring case and
+    spacing, with the expected answer.
+
+    Given a room_server, the quiz runs as one of its rooms instead of on a
+    port of its own, and every output file gets the room code appended.
+    With gateways, that many gateway processes share the port and terminate
+    the players' connections, and the engine only keeps the game state.
+    """
+
+    def __init__(self, deck_path, host='0.0.0.0', port=5000, min_players=1,
+                 lobby_timeout=60, question_time=20, advance_delay=5,
+                 results_path=None, workers=None, metrics_path=None, trace_path=None,
+                 room_server=None, room=None, gateways=0, log_path=None, export_path=None,
+                 recovery_grace=RECOVERY_GRACE):
+        self.deck_path = deck_path
+        self.min_players = min_players
+        self.lobby_timeout = lobby_timeout
+        self.question_time = question_time
+        self.workers = workers
+        self.room_server = room_server
+        self.host = host
+        self.port = port
+        self.gateways = gateways
+        self.gateway_processes = []
+        if room_server is None:
+            self.room = None
+            gateway_path = (os.path.join(tempfile.gettempdir(), f"quiz-engine-{os.getpid()}.sock")
+                            if gateways else None)
+            self.engine = QuizEngine(host, port, advance_delay=advance_delay,
+                                     metrics_path=metrics_path, trace_path=trace_path,
+                                     gateway_path=gateway_path, log_path=log_path,
+                                     export_path=export_path, recovery_grace=recovery_grace)
+            self.deck_cache = DeckCache(QuestionImporter())
+        else:
+            self.room = room or room_server.new_code()
+            self.engine = None  # opened on the room server in run()
+            self.engine_options = {
+                "advance_delay": advance_delay,
+                "metrics_path": room_path(metrics_path, self.room),
+                "trace_path": room_path(trace_path, self.room),
+                "log_path": room_path(log_path, self.room),
+                "export_path": room_path(export_path, self.room),
+                "recovery_grace": recovery_grace
+            }
+            self.deck_cache = room_server.deck_cache or DeckCache(QuestionImporter())
+        self.results_path = room_path(results_path, self.room) or os.path.join(
+            DEFAULT_RESULTS_DIR, f"results_{datetime.now():%Y%m%d_%H%M%S}"
+                                 f"{'_' + self.room if self.room else ''}.json")
+
+        self.players = []
+        self.scores = {}
+        self.questions = []
+        self.question_results = []  # one entry per question shown
+        self.question_baseline = {}  # scores when the current question was sent
+        self.graded = set()  # (player, question_num) already sent to grade_answer
+        self.started_at = None
+        self.finished = False
+
+    def run(self):
+        print(f"Loading deck {self.deck_path}")
+        self.questions = self.deck_cache.load(self.deck_path, self.workers)
+        print(f"Loaded {len(self.questions)} questions")
+
+        if self.room_server is None:
+            self.engine.start()
+            if self.gateways:
+                self.gateway_processes = start_gateways(
+                    self.gateways, self.engine.gateway_path, self.host, self.port)
+                print(f"Started {self.gateways} gateways on {self.host}:{self.port}")
+        else:
+            self.engine = self.room_server.create_room(self.room, **self.engine_options)
+            print(f"Players join room {self.room}")
+        self.engine.call(self.engine.load_questions, self.questions)
+        # The engine's timer closes each question and moves on by itself
+        self.engine.call(self.engine.set_timer, True, self.question_time)
+
+        lobby_opened = time.monotonic()
+        try:
+            while not self.finished:
+                try:
+                    event, data = self.engine.events.get(timeout=EVENT_POLL)
+                except queue.Empty:
+                    pass
+                else:
+                    self.handle_engine_event(event, data)
+                if self.started_at is None and self.ready_to_start(lobby_opened):
+                    self.start_quiz()
+        except KeyboardInterrupt:
+            print("Interrupted, writing partial results")
+        finally:
+            if self.room_server is None:
+                self.engine.stop()
+                stop_gateways(self.gateway_processes)
+            else:
+                self.room_server.close_room(self.room)
+            if self.started_at is not None:
+                self.write_results()
+
+    def ready_to_start(self, lobby_opened):
+        """Enough players joined, or the lobby timed out with somebody in it"""
+        if len(self.players) >= self.min_players:
+            return True
+        waited = time.monotonic() - lobby_opened
+        return self.lobby_timeout is not None and waited >= self.lobby_timeout and self.players
+
+    def start_quiz(self):
+        print(f"Starting quiz with {len(self.players)} players")
+        self.started_at = datetime.now()
+        self.engine.call(self.engine.start_quiz)
+
+    def handle_engine_event(self, event, data):
+        if event == "players":
+            if len(data["players"]) != len(self.players):
+                print(f"Connected players: {len(data['players'])}")
+            self.players = data["players"]
+        elif event == "scores":
+            self.scores = dict(data["scores"])
+        elif event == "question":
+            self.record_question_points()
+            print(f"Question {data['number']}/{len(self.questions)}: {data['question']['question']}")
+            self.question_results.append({
+                "question_number": data["number"],
+                "question": data["question"]["question"],
+                "points": {}
+            })
+        elif event == "pending_answer":
+            self.grade_pending(data["answer"])
+        elif event == "recovered":
+            # Picked up from the log after a crash: the quiz is already running
+            print(f"Resuming at question {data['question']}/{data['total']}")
+            self.started_at = datetime.now()
+        elif event == "quiz_ended":
+            self.scores = dict(data["scores"])
+            self.record_question_points()
+            self.finished = True
+
+    def record_question_points(self):
+        """Credit the score changes since the last question to it, graded answers included"""
+        if self.question_results:
+            self.question_results[-1]["points"] = {
+                player: score - self.question_baseline.get(player, 0)
+                for player, score in self.scores.items()
+                if score != self.question_baseline.get(player, 0)
+            }
+        self.question_baseline = dict(self.scores)
+
+    def grade_pending(self, answer):
+        """Grade the short answer at the head of the queue, once"""
+        if not answer:
+            return
+        key = (answer["player"], answer["question_num"])
+        if key in self.graded:
+            return  # Same head reported again before our grade was applied
+        self.graded.add(key)
+        is_correct = normalize_answer(answer["answer"]) == normalize_answer(answer["correct_answer"])
+        self.engine.call(self.engine.grade_answer, is_correct)
+
+    def write_results(self):
+        ranking = sorted(self.scores.items(), key=lambda item: item[1], reverse=True)
+        results = {
+            "deck": os.path.abspath(self.deck_path),
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "finished_at": datetime.now().isoformat(timespec="seconds"),
+            "completed": self.finished,
+            "question_time": self.question_time,
+            "players": len(self.scores),
+            "ranking": [{"rank": rank, "player": player, "score": score}
+                        for rank, (player, score) in enumerate(ranking, start=1)],
+            "questions": self.question_results
+        }
+        directory = os.path.dirname(os.path.abspath(self.results_path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = self.results_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+        os.replace(temp_path, self.results_path)
+        print(f"Results written to {self.results_path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a quiz without the host GUI")
+    parser.add_argument("deck", help="Excel question file")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--min-players", type=int, default=1,
+                        help="start as soon as this many players joined")
+    parser.add_argument("--lobby-timeout", type=float, default=60,
+                        help="seconds after which to start with whoever joined")
+    parser.add_argument("--question-time", type=int, default=20, help="seconds per question")
+    parser.add_argument("--advance-delay", type=float, default=5,
+                        help="seconds between a question closing and the next one")
+    parser.add_argument("--results", help="where to write the results JSON")
+    parser.add_argument("--workers", type=int, help="processes used to render images")
+    parser.add_argument("--metrics", help="dump counters and histograms to this JSON file every few seconds")
+    parser.add_argument("--trace", help="append a per-question timeline to this JSON lines file")
+    parser.add_argument("--rooms", type=int, default=0,
+                        help="host this many quizzes at once on the one port, each under a room code")
+    parser.add_argument("--gateways", type=int, default=0,
+                        help="terminate connections in this many processes sharing the port")
+    parser.add_argument("--log", help="write-ahead log; rerun with the same deck and log to resume after a crash")
+    parser.add_argument("--recovery-grace", type=float, default=RECOVERY_GRACE,
+                        help="seconds players have to come back after a recovery from the log")
+    parser.add_argument("--export", default=DEFAULT_EXPORT_DIR,
+                        help="folder for every answer and per-question statistics (Parquet, or CSV)")
+    args = parser.parse_args(argv)
+    if args.rooms and args.gateways:
+        parser.error("--gateways cannot be combined with --rooms")
+
+    if args.rooms:
+        run_rooms(args)
+        return
+    host = HeadlessHost(args.deck, host=args.host, port=args.port,
+                        min_players=args.min_players, lobby_timeout=args.lobby_timeout,
+                        question_time=args.question_time, advance_delay=args.advance_delay,
+                        results_path=args.results, workers=args.workers,
+                        metrics_path=args.metrics, trace_path=args.trace,
+                        gateways=args.gateways, log_path=args.log, export_path=args.export,
+                        recovery_grace=args.recovery_grace)
+    host.run()
+
+
+def run_rooms(args):
+    """Run several headless quizzes side by side on one RoomServer"""
+    room_server = RoomServer(args.host, args.port, deck_cache=DeckCache(QuestionImporter()))
+    room_server.start()
+    hosts = [HeadlessHost(args.deck, min_players=args.min_players,
+                          lobby_timeout=args.lobby_timeout, question_time=args.question_time,
+                          advance_delay=args.advance_delay, results_path=args.results,
+                          workers=args.workers, metrics_path=args.metrics,
+                          trace_path=args.trace, log_path=args.log, export_path=args.export,
+                          recovery_grace=args.recovery_grace, room_server=room_server, room=code)
+             for code in room_codes(args.log, args.rooms, room_server)]
+    threads = [threading.Thread(target=host.run, name=f"room-{host.room}") for host in hosts]
+    for thread in threads:
+        thread.start()
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=EVENT_POLL)
+    except KeyboardInterrupt:
+        print("Interrupted, writing partial results")
+        for host in hosts:
+            host.finished = True  # each host leaves its event loop and writes what it has
+        for thread in threads:
+            thread.join()
+    finally:
+        room_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# leaderboard.py
+from bisect import bisect_left, insort
+from itertools import count, islice
+
+
+class Leaderboard:
+    """
+    Players kept in rank order as scores change.
+
+    Entries are (-score, tick, player) tuples in a sorted list, so the
+    highest score comes first and a tie goes to whoever reached that score
+    first. Finding a player's entry or rank is a binary search; an update
+    moves one entry instead of re-sorting the whole room.
+    """
+
+    def __init__(self):
+        self.entries = []  # sorted (-score, tick, player)
+        self.keys = {}  # player -> their current entry
+        self.ticks = count()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, player):
+        return player in self.keys
+
+    def update(self, player, score):
+        """Insert a player or move them to their new score"""
+        old = self.keys.get(player)
+        if old is not None:
+            if old[0] == -score:
+                return  # Unchanged score keeps its place among ties
+            del self.entries[bisect_left(self.entries, old)]
+        key = (-score, next(self.ticks), player)
+        insort(self.entries, key)
+        self.keys[player] = key
+
+    def remove(self, player):
+        key = self.keys.pop(player, None)
+        if key is not None:
+            del self.entries[bisect_left(self.entries, key)]
+
+    def score(self, player):
+        return -self.keys[player][0]
+
+    def rank(self, player):
+        """1-based position of a player, or None if unknown"""
+        key = self.keys.get(player)
+        if key is None:
+            return None
+        return bisect_left(self.entries, key) + 1
+
+    def top(self, k):
+        """The k best players as (player, score) pairs"""
+        return [(player, -negative) for negative, _, player in islice(self.entries, k)]
+
+    def ranks(self):
+        """Yield (player, rank, score) for everyone, best first"""
+        for position, (negative, _, player) in enumerate(self.entries, start=1):
+            yield player, position, -negative
@@ -0,0 +1,161 @@
+# metrics.py
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Upper bounds in seconds; latencies past the last bucket land in the overflow count
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; cheap to update and good enough for percentiles"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, fraction):
+        """Upper bound of the bucket holding the given quantile"""
+        if not self.count:
+            return None
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.max
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99)
+        }
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms for a running quiz.
+
+    Updated from the engine loop and the Tk thread, so every update takes a
+    lock; updates are a dict lookup and an add, cheap enough for hot paths.
+    Samplers are callables run at snapshot time for values that are cheaper
+    to read than to track, like queue depths.
+
+    With a trace path set, begin_question() opens a timeline for each
+    question and trace() appends offsets from the question's start to it;
+    the timeline is written as one JSON line when the next question begins.
+    """
+
+    def __init__(self, trace_path=None):
+        self.lock = threading.Lock()
+        self.started = time.monotonic()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.samplers = {}  # gauge name -> callable returning its value
+        self.trace_path = trace_path
+        self.timeline = None  # current question's trace, or None
+
+    def inc(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def take_counters(self):
+        """Return the counters and start them over, for handing them on elsewhere"""
+        with self.lock:
+            counters, self.counters = self.counters, {}
+            return counters
+
+    def set_gauge(self, name, value):
+        with self.lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value):
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(value)
+
+    def add_sampler(self, name, sampler):
+        self.samplers[name] = sampler
+
+    def snapshot(self):
+        gauges = {}
+        for name, sampler in self.samplers.items():
+            try:
+                gauges[name] = sampler()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        with self.lock:
+            gauges.update(self.gauges)
+            return {
+                "time": time.time(),
+                "uptime": time.monotonic() - self.started,
+                "counters": dict(self.counters),
+                "gauges": gauges,
+                "histograms": {name: histogram.as_dict()
+                               for name, histogram in self.histograms.items()}
+            }
+
+    def dump(self, path):
+        """Write a snapshot as JSON, replacing the previous one atomically"""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+    # ---- Per-question trace -----------------------------------------------
+
+    def begin_question(self, question_number):
+        if not self.trace_path:
+            return
+        self.end_question()
+        self.timeline = {
+            "question_number": question_number,
+            "started_at": time.time(),
+            "start": time.monotonic(),
+            "events": []
+        }
+
+    def trace(self, event, **fields):
+        timeline = self.timeline
+        if timeline is None:
+            return
+        fields["t"] = round(time.monotonic() - timeline["start"], 6)
+        fields["event"] = event
+        timeline["events"].append(fields)
+
+    def end_question(self):
+        """Append the current timeline to the trace file"""
+        timeline, self.timeline = self.timeline, None
+        if timeline is None:
+            return
+        timeline.pop("start")
+        try:
+            with open(self.trace_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(timeline) + "\n")
+        except OSError as e:
+            print(f"Could not write question trace: {e}")
@@ -1,53 +1,76 @@
 import pandas as pd
-import json
+import numpy as np
 from pathlib import Path
-import base64
+import multiprocessing
 import os
+import sys
+from io import BytesIO
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, features
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import asset_hash
 
 class QuestionImporter:
-    def __init__(self):
+    def __init__(self, display_size=(800, 600), image_format="WEBP", image_quality=80,
+                 thumbnail_size=(400, 300)):
         self.required_columns = ['question', 'option_1', 'option_2', 'option_3', 'option_4', 'correct_answer', 'image_link']
         self.supported_extensions = ['.png', '.jpg', '.jpeg']
+        # Images are converted once at load time into display-ready renditions
+        self.display_size = display_size
+        self.image_quality = image_quality
+        self.thumbnail_size = thumbnail_size  # host preview size, None to skip
+        if image_format.upper() == "WEBP" and not features.check("webp"):
+            image_format = "JPEG"  # Pillow built without WebP support
+        self.image_format = image_format.upper()
         
-    def determine_question_type(self, row):
+    def classify_rows(self, df):
         """
-        Determine question type based on options and correct answer:
+        Determine every row's question type at once from column masks:
         - If only option_1 is filled and no correct_answer, it's a short answer
         - If all options are filled and has correct_answer, it's multiple choice
+        - Anything else is invalid
         """
-        has_option_1 = pd.notna(row['option_1'])
-        other_options_empty = all(pd.isna(row[f'option_{i}']) for i in range(2, 5))
-        no_correct_answer = pd.isna(row['correct_answer'])
+        filled = df[[f'option_{i}' for i in range(1, 5)]].notna().to_numpy()
+        has_correct = df['correct_answer'].notna().to_numpy()
         
-        if has_option_1 and other_options_empty and no_correct_answer:
-            return 'short_answer'
-        elif all(pd.notna(row[f'option_{i}']) for i in range(1, 5)) and pd.notna(row['correct_answer']):
-            return 'multiple_choice'
-        else:
-            raise ValueError(f"Invalid question format in row with question: {row['question']}\n"
-                           "For short answer: fill only option_1 and leave correct_answer empty\n"
-                           "For multiple choice: fill all options and correct_answer")
+        short_answer = filled[:, 0] & ~filled[:, 1:].any(axis=1) & ~has_correct
+        multiple_choice = filled.all(axis=1) & has_correct
+        return np.select([short_answer, multiple_choice],
+                         ['short_answer', 'multiple_choice'],
+                         default='invalid')
 
     def validate_excel_format(self, df):
-        """Validate if the Excel file has the correct format"""
+        """
+        Validate if the Excel file has the correct format.
+        Returns the question type of each row; raises ValueError listing every bad row.
+        """
         # Check if all required columns exist (except image_link which is optional)
         required_non_image = [col for col in self.required_columns if col != 'image_link']
         missing_columns = [col for col in required_non_image if col not in df.columns]
         if missing_columns:
             raise ValueError(f"Missing required columns: {', '.join(missing_columns)}")
             
-        # Validate each row's format
-        for idx, row in df.iterrows():
-            try:
-                question_type = self.determine_question_type(row)
-                if question_type == 'multiple_choice':
-                    if not 1 <= row['correct_answer'] <= 4:
-                        raise ValueError(f"Invalid correct_answer value. Must be between 1-4. Found: {row['correct_answer']}")
-            except ValueError as e:
-                raise ValueError(f"Row {idx + 2}: {str(e)}")  # +2 because Excel rows start at 1 and have header
+        question_types = self.classify_rows(df)
+        correct = pd.to_numeric(df['correct_answer'], errors='coerce').to_numpy()
+        bad_correct = (question_types == 'multiple_choice') & ~((correct >= 1) & (correct <= 4))
+        
+        # +2 because Excel rows start at 1 and have header
+        errors = []
+        for idx in np.flatnonzero((question_types == 'invalid') | bad_correct):
+            if question_types[idx] == 'invalid':
+                errors.append(f"Row {idx + 2}: Invalid question format in row with question: "
+                              f"{df['question'].iat[idx]}")
+            else:
+                errors.append(f"Row {idx + 2}: Invalid correct_answer value. Must be between 1-4. "
+                              f"Found: {df['correct_answer'].iat[idx]}")
+        if errors:
+            raise ValueError(f"{len(errors)} invalid row(s):\n" + "\n".join(errors) +
+                             "\nFor short answer: fill only option_1 and leave correct_answer empty\n"
+                             "For multiple choice: fill all options and correct_answer (1-4)")
+        return question_types
 
-    def load_image(self, image_path):
-        """Load and encode image if it exists"""
+    def resolve_image_path(self, image_path):
+        """Find the image file for an image_link cell, or None"""
         if not image_path or pd.isna(image_path):
             return None
 
@@ -75,15 +98,85 @@ class QuestionImporter:
         if not resource_path.is_file():
             print(f"Image not found: {resource_path}")
             return None
+        return resource_path.resolve()
+
+    def load_image(self, image_path):
+        """Load raw image bytes if the image exists"""
+        resource_path = self.resolve_image_path(image_path)
+        if resource_path is None:
+            return None
 
         try:
             with open(resource_path, "rb") as img_file:
-                return base64.b64encode(img_file.read()).decode('utf-8')
+                return img_file.read()
         except Exception as e:
             print(f"Error loading image {resource_path}: {e}")
             return None
 
-    def load_questions(self, file_path):
+    def fit_to_box(self, image, box):
+        """Scale an image to fit the box while maintaining aspect ratio"""
+        max_width, max_height = box
+        ratio = min(max_width/image.width, max_height/image.height)
+        new_size = (max(1, int(image.width * ratio)), max(1, int(image.height * ratio)))
+        if new_size == image.size:
+            return image
+        return image.resize(new_size, Image.LANCZOS)
+
+    def encode_rendition(self, image):
+        """Compress an image with the configured format and quality"""
+        if self.image_format == "JPEG" and image.mode != "RGB":
+            image = image.convert("RGB")  # JPEG has no alpha channel
+        elif image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA")
+        output = BytesIO()
+        image.save(output, format=self.image_format, quality=self.image_quality)
+        return output.getvalue()
+
+    def prepare_image(self, image_data):
+        """
+        Build the renditions shown at question time.
+        Returns (display_bytes, thumbnail_bytes); the thumbnail is None when disabled.
+        """
+        try:
+            image = Image.open(BytesIO(image_data))
+            image.load()
+        except Exception as e:
+            print(f"Error decoding image: {e}")
+            return None, None
+
+        display = self.encode_rendition(self.fit_to_box(image, self.display_size))
+        thumbnail = None
+        if self.thumbnail_size:
+            thumbnail = self.encode_rendition(self.fit_to_box(image, self.thumbnail_size))
+        return display, thumbnail
+
+    def image_settings(self):
+        """Rendition settings, used to rebuild an importer in worker processes"""
+        return {
+            "display_size": tuple(self.display_size),
+            "image_format": self.image_format,
+            "image_quality": self.image_quality,
+            "thumbnail_size": tuple(self.thumbnail_size) if self.thumbnail_size else None
+        }
+
+    def render_images(self, image_paths, workers=None):
+        """
+        Read and prepare every distinct image, in a process pool when there
+        is more than one. Returns {path: (display_bytes, thumbnail_bytes)}.
+        """
+        image_paths = list(dict.fromkeys(image_paths))
+        settings = self.image_settings()
+        if len(image_paths) < 2 or workers == 1:
+            results = [render_image_file(path, settings) for path in image_paths]
+        else:
+            # Spawn, not fork: the host GUI and the engine loop thread are running
+            with ProcessPoolExecutor(max_workers=workers,
+                                     mp_context=multiprocessing.get_context("spawn")) as pool:
+                results = list(pool.map(render_image_file, image_paths,
+                                        [settings] * len(image_paths)))
+        return dict(zip(image_paths, results))
+
+    def load_questions(self, file_path, workers=None):
         """Load questions from Excel file and return in quiz format"""
         try:
             # Read Excel file
@@ -94,33 +187,40 @@ class QuestionImporter:
                 df['image_link'] = None
             
             # Validate format
-            self.validate_excel_format(df)
+            question_types = self.validate_excel_format(df)
+            
+            # Decode and re-encode all images up front, in parallel
+            image_paths = [self.resolve_image_path(link) for link in df['image_link']]
+            renditions = self.render_images([path for path in image_paths if path], workers)
+            
+            # Convert to quiz format from whole columns instead of row objects
+            texts = df['question'].astype(str).tolist()
+            options = df[[f'option_{i}' for i in range(1, 5)]].astype(str).to_numpy().tolist()
+            correct = pd.to_numeric(df['correct_answer'], errors='coerce').fillna(1).astype(int).tolist()
             
-            # Convert to quiz format
             questions = []
-            for _, row in df.iterrows():
-                image_data = self.load_image(row['image_link'])
-                question_type = self.determine_question_type(row)
+            for i, question_type in enumerate(question_types.tolist()):
+                image_path = image_paths[i]
+                image_data, thumbnail = renditions.get(image_path, (None, None))
                 
                 question = {
-                    "question": str(row['question']),
+                    "question": texts[i],
                     "type": question_type,
-                    "image": image_data
+                    "image": image_data,  # display-ready rendition, sent as is
+                    "thumbnail": thumbnail,  # smaller rendition for the host preview
+                    # Content address clients use to fetch and cache the image
+                    "image_hash": asset_hash(image_data) if image_data else None,
+                    "image_source": str(image_path) if image_path else None
                 }
                 
                 if question_type == 'multiple_choice':
                     question.update({
-                        "options": [
-                            str(row['option_1']),
-                            str(row['option_2']),
-                            str(row['option_3']),
-                            str(row['option_4'])
-                        ],
-                        "correct": int(row['correct_answer']) - 1  # Convert to 0-based index
+                        "options": options[i],
+                        "correct": correct[i] - 1  # Convert to 0-based index
                     })
                 else:  # short_answer
                     question.update({
-                        "answer": str(row['option_1']),  # Correct answer stored in option_1
+                        "answer": options[i][0],  # Correct answer stored in option_1
                         "graded": False,
                         "score": None
                     })
@@ -149,4 +249,15 @@ class QuestionImporter:
         }
         
         df = pd.DataFrame(template_data)
-        df.to_excel(file_path, index=False)
\ No newline at end of file
+        df.to_excel(file_path, index=False)
+
+
+def render_image_file(image_path, settings):
+    """Process pool entry point: load one image file and build its renditions"""
+    try:
+        with open(image_path, "rb") as img_file:
+            image_data = img_file.read()
+    except Exception as e:
+        print(f"Error loading image {image_path}: {e}")
+        return None, None
+    return QuestionImporter(**settings).prepare_image(image_data)
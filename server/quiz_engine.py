@@ -0,0 +1,915 @@
+# quiz_engine.py
+import asyncio
+import queue
+import secrets
+import threading
+import time
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import (CHANNEL_ASSETS, OutboundMessage, ProtocolError, check_hello,
+                      choose_codec, encode_asset, encode_message, make_rejected,
+                      make_welcome, read_message_async)
+from scoring import ScoreKeeper
+from connection import ClientConnection
+from gateway_link import GatewayLink, relay_frame
+from metrics import Metrics
+from event_log import EventLog, deck_fingerprint
+from answer_export import AnswerExport
+
+HANDSHAKE_TIMEOUT = 5  # seconds a new connection has to send its hello
+LATE_ANSWER_GRACE = 0.5  # seconds after the deadline an answer still counts, for transit time
+ADVANCE_DELAY = 5  # seconds the results stay up before a timed quiz moves on
+SESSION_GRACE = 30  # seconds a dropped player's score and answers are kept for a resume
+# Seconds recovered players have to come back after a crash: the host's restart
+# can outlast the clients' own retries, so players may have to reconnect by hand
+RECOVERY_GRACE = 600
+HEARTBEAT_INTERVAL = 5  # seconds between heartbeats to each player
+HEARTBEAT_TIMEOUT = 15  # seconds of silence after which a player counts as gone
+
+
+async def read_hello(reader, writer):
+    """
+    Read and check a new connection's hello. Returns (hello, player name),
+    or (None, None) after rejecting and closing a bad handshake.
+    """
+    address = writer.get_extra_info("peername")
+    try:
+        hello = await asyncio.wait_for(read_message_async(reader), HANDSHAKE_TIMEOUT)
+        return hello, check_hello(hello)
+    except ProtocolError as e:
+        print(f"Rejected client {address}: {e}")
+        writer.write(encode_message(make_rejected(str(e))))
+        writer.close()
+    except (asyncio.TimeoutError, asyncio.IncompleteReadError, OSError) as e:
+        print(f"Handshake failed for {address}: {e}")
+        writer.close()
+    return None, None
+
+
+class QuizEngine:
+    """
+    Headless quiz core running on a single asyncio event loop.
+
+    The engine owns the listening socket, one reader task per player, the
+    broadcasts and the question lifecycle. All game state is only touched
+    from the loop thread, and scores/answers have a single writer, the
+    ScoreKeeper. Other threads talk to the engine through call(), and the
+    engine reports back by putting (event, data) tuples on the events queue.
+
+    Under a RoomServer each engine is one room: it shares the server's loop
+    and listening socket, and only sees connections that asked for its code.
+    With a gateway_path the player sockets live in gateway processes instead
+    (see gateway.py) and the engine keeps only the game state.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5000, backlog=1024, events=None,
+                 prefetch_ahead=None, score_batch_window=0.25, auto_advance=True,
+                 leaderboard_size=10, session_grace=SESSION_GRACE, recovery_grace=RECOVERY_GRACE,
+                 heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT,
+                 advance_delay=ADVANCE_DELAY, metrics=None, metrics_path=None,
+                 metrics_interval=5, trace_path=None, gateway_path=None, log_path=None,
+                 export_path=None):
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.prefetch_ahead = prefetch_ahead  # images to prefetch ahead, None for all
+        self.score_batch_window = score_batch_window  # seconds to coalesce score changes
+        self.auto_advance = auto_advance  # move on by itself after a timed question closes
+        self.advance_delay = advance_delay
+        self.metrics = metrics if metrics is not None else Metrics(trace_path)
+        self.metrics_path = metrics_path  # periodic JSON dump of the metrics, None to disable
+        self.metrics_interval = metrics_interval
+        self.leaderboard_size = leaderboard_size  # players listed in the leaderboard message
+        self.session_grace = session_grace
+        self.recovery_grace = recovery_grace
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.gateway_path = gateway_path  # local socket for gateway processes, instead of host:port
+        # Write-ahead log of every state change, replayed when the same deck is loaded again
+        self.event_log = EventLog(log_path, metrics=self.metrics) if log_path else None
+        # Every scored answer, streamed to a folder per quiz for analysis afterwards
+        self.answer_export = AnswerExport(export_path, metrics=self.metrics) if export_path else None
+        self.events = events if events is not None else queue.Queue()
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.startup_error = None
+        self.tasks = []  # scorer, heartbeats and metrics dump, cancelled by detach()
+        self.room = None  # room code when hosted by a RoomServer
+
+        self.clients = {}  # player name -> ClientConnection, or RemotePlayer behind a gateway
+        self.gateways = set()  # GatewayLinks of the connected gateway processes
+        self.open_writers = set()  # every accepted socket, game or assets
+        self.connection_tasks = set()  # their handler tasks, awaited at shutdown
+        self.sessions = {}  # session token -> player name
+        self.session_tokens = {}  # player name -> session token
+        self.disconnected = {}  # player name -> call_later handle that ends their session
+        self.scorer = None  # created on the loop thread
+        self.snapshot = None  # latest ScoreSnapshot published by the scorer
+        self.sent_leaderboard = None  # (top, player count) clients currently hold
+        self.sent_ranks = {}  # player name -> (rank, score) last sent to that player
+        self.score_flush = None  # pending call_later handle for the next score broadcast
+        self.questions = []
+        self.assets = {}  # image hash -> image bytes, served on the asset channel
+        self.prefetch_hashes = []  # images players should have cached right now
+        self.assets_ready = {}  # player name -> hashes the player has cached
+        self.current_question = 0
+        self.question_message = None  # data of the last question sent, replayed on resume
+        self.question_active = False   # Track if a question is currently active
+        self.all_answered_sent = False
+        self.timer_mode = False
+        self.question_time = 30  # default 30 seconds
+        self.deadline = None  # wall-clock time the current timed question closes
+        self.close_timer = None  # call_later handle that closes the timed question
+        self.advance_timer = None  # call_later handle that sends the next question
+        self.awaiting_grades = False  # auto-advance held back until short answers are graded
+        self.deck_id = None  # fingerprint of the loaded deck, checked before replaying the log
+        self.quiz_ended = False
+
+    # ---- Thread bridge -------------------------------------------------
+
+    def start(self):
+        """Start the event loop in a background thread and begin listening"""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,))
+        self.thread.daemon = True
+        self.thread.start()
+        ready.wait()
+        if self.startup_error:
+            raise self.startup_error
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            if self.gateway_path:
+                if os.path.exists(self.gateway_path):
+                    os.unlink(self.gateway_path)  # left over from an engine that crashed
+                self.server = self.loop.run_until_complete(asyncio.start_unix_server(
+                    self.handle_gateway, self.gateway_path))
+            else:
+                self.server = self.loop.run_until_complete(asyncio.start_server(
+                    self.handle_connection, self.host, self.port,
+                    backlog=self.backlog, reuse_address=True))
+        except Exception as e:
+            self.startup_error = e
+            ready.set()
+            return
+        if self.gateway_path:
+            print(f"Engine waiting for gateways on {self.gateway_path}")
+        else:
+            print(f"Server started on {self.host}:{self.port}")
+        self.attach(self.loop)
+        ready.set()
+        self.loop.run_forever()
+        # Sockets were aborted in _shutdown: let connection tasks see that and
+        # clean up, then cancel what is left before the loop goes away
+        if self.connection_tasks:
+            self.loop.run_until_complete(asyncio.wait(list(self.connection_tasks), timeout=1))
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def attach(self, loop):
+        """
+        Create the game state and background tasks on a running or about to
+        run loop. start() does this for a standalone engine; a RoomServer
+        attaches each of its rooms to the loop they all share.
+        """
+        self.loop = loop
+        self.scorer = ScoreKeeper(self.publish_snapshot, self.leaderboard_size, self.metrics,
+                                  log=self.log_score_command if self.event_log else None,
+                                  export=self.answer_export.add if self.answer_export else None)
+        self.snapshot = self.scorer.snapshot
+        self.tasks = [loop.create_task(self.scorer.run()),
+                      loop.create_task(self.send_heartbeats())]
+        if self.event_log:
+            self.tasks.append(loop.create_task(self.event_log.run(self.log_state)))
+        if self.answer_export:
+            self.tasks.append(loop.create_task(self.answer_export.run()))
+        self.add_metric_samplers()
+        if self.metrics_path:
+            self.tasks.append(loop.create_task(self.dump_metrics()))
+
+    def detach(self):
+        """Drop every player and stop this engine's tasks, leaving the loop running"""
+        self.cancel_timers()
+        if self.score_flush is not None:
+            self.score_flush.cancel()
+        for handle in self.disconnected.values():
+            handle.cancel()
+        self.disconnected.clear()
+        for writer in self.open_writers:
+            writer.transport.abort()
+        for task in self.tasks:
+            task.cancel()
+        if self.metrics_path:
+            self.write_metrics()
+        self.metrics.end_question()
+        if self.event_log:
+            self.event_log.close()
+
+    def call(self, func, *args):
+        """Schedule func(*args) on the engine loop from any thread"""
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        """Close the listening socket and stop the loop"""
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._shutdown)
+            self.thread.join(timeout=5)
+
+    def _shutdown(self):
+        if self.server:
+            self.server.close()
+        for writer in self.open_writers:
+            writer.transport.abort()
+        if self.event_log:
+            self.event_log.close()
+        self.loop.stop()
+
+    def emit(self, event, **data):
+        """Report a state change to the UI thread"""
+        self.events.put((event, data))
+
+    def emit_players(self):
+        self.emit("players", players=list(self.clients), answered=self.snapshot.answered)
+
+    # ---- Metrics ------------------------------------------------------------
+
+    def add_metric_samplers(self):
+        """Gauges read at dump time on the loop thread"""
+        self.metrics.add_sampler("players_connected", lambda: len(self.clients))
+        self.metrics.add_sampler("players_reconnecting", lambda: len(self.disconnected))
+        self.metrics.add_sampler("score_queue_depth", lambda: self.scorer.queue.qsize())
+        self.metrics.add_sampler("ui_event_queue_depth", self.events.qsize)
+        self.metrics.add_sampler("send_queue_max", lambda: max(
+            (len(connection.queue) for connection in self.clients.values()), default=0))
+        self.metrics.add_sampler("send_queue_bytes", lambda: sum(
+            connection.queued_bytes for connection in self.clients.values()))
+
+    async def dump_metrics(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            self.write_metrics()
+
+    def write_metrics(self):
+        try:
+            self.metrics.dump(self.metrics_path)
+        except OSError as e:
+            print(f"Could not write metrics: {e}")
+
+    def publish_snapshot(self, snapshot, changed):
+        """Called by the ScoreKeeper once per burst of applied commands"""
+        self.snapshot = snapshot
+        if "scores" in changed:
+            self.emit("scores", scores=snapshot.scores, top=snapshot.top)
+            self.schedule_score_broadcast()
+        if "answered" in changed:
+            self.metrics.trace("answers", count=len(snapshot.answered))
+            self.emit_players()
+            self.check_all_answered()
+        if "pending" in changed:
+            self.emit("pending_answer", answer=snapshot.pending_answer)
+            if self.awaiting_grades and not snapshot.pending_answer:
+                # Last short answer graded: resume the timed quiz
+                self.awaiting_grades = False
+                self.advance_timer = self.loop.call_later(self.advance_delay, self.advance_question)
+
+    def check_all_answered(self):
+        """Close the question once every connected player has answered"""
+        if (self.question_active and not self.all_answered_sent and self.clients
+                and self.clients.keys() <= self.snapshot.answered):
+            self.all_answered_sent = True
+            # Nobody left to wait for; close (and score) outside the scorer's publish
+            self.loop.call_soon(self.close_question)
+
+    # ---- Connections ----------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        hello, player_name = await read_hello(reader, writer)
+        if hello is not None:
+            await self.accept(hello, player_name, reader, writer)
+
+    async def handle_gateway(self, reader, writer):
+        """One gateway process connected; serve its players until it goes away"""
+        task = asyncio.current_task()
+        link = GatewayLink(self, reader, writer)
+        self.gateways.add(link)
+        self.open_writers.add(writer)
+        self.connection_tasks.add(task)
+        print(f"Gateway {len(self.gateways)} connected")
+        try:
+            await link.serve()
+        finally:
+            self.gateways.discard(link)
+            self.open_writers.discard(writer)
+            self.connection_tasks.discard(task)
+            writer.close()
+            print("Gateway disconnected")
+
+    async def accept(self, hello, player_name, reader, writer):
+        """Serve a connection whose hello was read, here or by a RoomServer"""
+        task = asyncio.current_task()
+        self.open_writers.add(writer)
+        self.connection_tasks.add(task)
+        try:
+            await self.serve_connection(hello, player_name, reader, writer)
+        finally:
+            self.open_writers.discard(writer)
+            self.connection_tasks.discard(task)
+
+    async def serve_connection(self, hello, player_name, reader, writer):
+        if hello.get("channel") == CHANNEL_ASSETS:
+            # Images are already compressed, so the asset channel stays raw
+            writer.write(encode_message(make_welcome()))
+            await self.serve_assets(player_name, reader, writer)
+            return
+
+        try:
+            token, resumed = self.admit(player_name, hello.get("session"))
+        except ProtocolError as e:
+            writer.write(encode_message(make_rejected(str(e))))
+            writer.close()
+            return
+
+        codec = choose_codec(hello.get("compression"))
+        writer.write(encode_message(make_welcome(codec, token, resumed)))
+        connection = ClientConnection(player_name, writer, codec=codec,
+                                      resync=self.send_leaderboard, metrics=self.metrics)
+        self.add_player(connection, resumed)
+
+        try:
+            while True:
+                message = await read_message_async(reader, codec)
+                # Stamp on arrival: answer speed is measured by the server's clock
+                received = time.monotonic()
+                connection.last_seen = received
+                self.handle_client_message(connection, message, received)
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+        finally:
+            self.remove_player(connection)
+            connection.close()
+
+    def admit(self, player_name, token):
+        """
+        Check a joining player against the open sessions and return their
+        (session token, resumed). Raises ProtocolError if the name is taken.
+        """
+        resumed = token is not None and self.sessions.get(token) == player_name
+        if not resumed and (player_name in self.clients or player_name in self.disconnected):
+            # Never silently take over someone else's seat
+            raise ProtocolError(f"Name {player_name!r} is already in use")
+        if not resumed:
+            token = secrets.token_urlsafe(16)
+            self.sessions[token] = player_name
+            self.session_tokens[player_name] = token
+            self.record("session", token, player_name)
+        return token, resumed
+
+    def add_player(self, connection, resumed):
+        """Seat an admitted connection, local or relayed by a gateway"""
+        if resumed:
+            self.resume_session(connection)
+        else:
+            self.clients[connection.name] = connection
+            self.scorer.submit("join", connection.name)
+            self.send_leaderboard(connection)
+            # Let the new player download images while waiting in the lobby
+            self.send_prefetch(connection)
+
+    def remove_player(self, connection):
+        """A player's connection ended: keep their state for a while, unless a resumed connection took over"""
+        player_name = connection.name
+        if self.clients.get(player_name) is connection:
+            del self.clients[player_name]
+            self.sent_ranks.pop(player_name, None)
+            self.disconnected[player_name] = self.loop.call_later(
+                self.session_grace, self.expire_session, player_name)
+            self.emit_players()
+            self.check_all_answered()
+
+    async def send_heartbeats(self):
+        """
+        Ping every player and evict the ones that went silent, so half-open
+        sockets stop counting as players still to answer.
+        """
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            now = time.monotonic()
+            # One shared frame for everyone; the ack echoes sent back for the RTT
+            heartbeat = OutboundMessage({
+                "type": "heartbeat",
+                "sent": now,
+                "timeout": self.heartbeat_timeout
+            })
+            for connection in list(self.clients.values()):
+                if connection.gateway is not None:
+                    continue  # the gateway holding the socket runs its heartbeats
+                if now - connection.last_seen > self.heartbeat_timeout:
+                    rtt = f"{connection.rtt * 1000:.0f} ms" if connection.rtt is not None else "unknown"
+                    print(f"Evicting {connection.name}: silent for {now - connection.last_seen:.1f}s "
+                          f"(last RTT {rtt})")
+                    # The reader task sees the abort and runs the normal disconnect path
+                    self.metrics.inc("heartbeat_evictions")
+                    connection.close(abort=True)
+                else:
+                    connection.send(heartbeat)
+
+    def resume_session(self, connection):
+        """Swap a reconnected player in and replay what they missed"""
+        player_name = connection.name
+        handle = self.disconnected.pop(player_name, None)
+        if handle is not None:
+            handle.cancel()
+        old = self.clients.get(player_name)
+        self.clients[player_name] = connection
+        if old is not None:
+            old.close(abort=True)  # a half-dead socket the client already gave up on
+        print(f"Player {player_name} resumed their session")
+        self.emit_players()
+        self.send_leaderboard(connection)
+        self.send_prefetch(connection)
+        if self.question_active and self.question_message:
+            connection.send(OutboundMessage({
+                "type": "question",
+                "data": dict(self.question_message,
+                             answered=player_name in self.snapshot.answered)
+            }))
+
+    def expire_session(self, player_name):
+        """The grace period ran out: the player really left"""
+        self.disconnected.pop(player_name, None)
+        token = self.session_tokens.pop(player_name, None)
+        self.sessions.pop(token, None)
+        self.record("session_end", player_name)
+        self.scorer.submit("leave", player_name)
+        self.assets_ready.pop(player_name, None)
+        self.emit_prefetch_progress()
+
+    async def serve_assets(self, player_name, reader, writer):
+        """Answer image requests and prefetch acks on a player's side connection"""
+        try:
+            while True:
+                request = await read_message_async(reader)
+                if not isinstance(request, dict):
+                    continue
+                if request.get("type") == "asset_ready":
+                    self.mark_asset_ready(player_name, request.get("hash"))
+                    continue
+                if request.get("type") != "get_asset":
+                    continue
+                digest = request.get("hash")
+                data = self.assets.get(digest)
+                if data is None:
+                    writer.write(encode_message({"type": "asset_missing", "hash": digest}))
+                else:
+                    writer.write(encode_asset(digest, data))
+                # Only this player's asset download waits for a slow link
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ProtocolError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    def broadcast(self, message, droppable=False):
+        """Serialize a message once and queue the same buffer on every connection"""
+        started = time.perf_counter()
+        outbound = OutboundMessage(message, on_complete=self.record_broadcast)
+        for connection in self.clients.values():
+            if connection.gateway is None:
+                connection.send(outbound, droppable)
+        if self.gateways:
+            # One envelope for every gateway; each fans it out to its own players
+            frame = relay_frame(outbound.payload, op="broadcast", droppable=droppable)
+            for gateway in self.gateways:
+                gateway.write(frame)
+        outbound.seal()
+        self.metrics.observe("broadcast_enqueue_seconds", time.perf_counter() - started)
+        self.metrics.trace("broadcast", type=outbound.type, recipients=len(self.clients),
+                           bytes=outbound.serialized_bytes)
+        return outbound
+
+    def record_broadcast(self, outbound):
+        """Called once every local player's copy of a broadcast was written or dropped"""
+        if not outbound.recipients and not outbound.dropped:
+            return  # every player is behind a gateway, which counts its own sends
+        delivery = time.monotonic() - outbound.created_at
+        self.metrics.observe("broadcast_delivery_seconds", delivery)
+        self.metrics.trace("broadcast_delivered", type=outbound.type, seconds=round(delivery, 6),
+                           recipients=outbound.recipients, sent_bytes=outbound.sent_bytes,
+                           dropped=outbound.dropped)
+
+    def handle_client_message(self, connection, message, received):
+        self.metrics.inc("messages_in")
+        if isinstance(message, dict) and message.get("type") == "resync":
+            # Client wants its standings again
+            self.send_leaderboard(connection)
+            return
+        if isinstance(message, dict) and message.get("type") == "heartbeat_ack":
+            sent = message.get("sent")
+            if isinstance(sent, (int, float)):
+                connection.record_rtt(received - sent)
+                self.metrics.observe("heartbeat_rtt_seconds", received - sent)
+            return
+        if isinstance(message, dict) and message.get("type") == "ping":
+            # Clock sync: clients estimate their offset from the server clock
+            connection.send(OutboundMessage({
+                "type": "pong",
+                "client_time": message.get("client_time"),
+                "server_time": time.time()
+            }))
+            return
+        self.scorer.submit("answer", connection.name, message, received)
+
+    # ---- Score broadcasts ---------------------------------------------------
+
+    def schedule_score_broadcast(self):
+        """Coalesce score changes for a short window before broadcasting"""
+        if self.score_flush is None:
+            self.score_flush = self.loop.call_later(self.score_batch_window,
+                                                    self.broadcast_scores)
+
+    def leaderboard_message(self):
+        # seq is the snapshot version: clients ignore standings older than ones they have
+        return {
+            "type": "leaderboard",
+            "seq": self.snapshot.version,
+            "top": self.snapshot.top,
+            "players": len(self.scorer.leaderboard)
+        }
+
+    def rank_message(self, rank, score):
+        return OutboundMessage({"type": "rank", "seq": self.snapshot.version,
+                                "rank": rank, "score": score})
+
+    def broadcast_scores(self):
+        """
+        Send the top of the leaderboard to everyone, and a rank update only to
+        players whose own rank or score moved. Nobody receives the whole table.
+        """
+        if self.score_flush is not None:
+            self.score_flush.cancel()
+            self.score_flush = None
+        leaderboard = (self.snapshot.top, len(self.scorer.leaderboard))
+        if leaderboard != self.sent_leaderboard:
+            self.sent_leaderboard = leaderboard
+            # Slow clients may skip updates; they get fresh standings when they catch up
+            self.broadcast(self.leaderboard_message(), droppable=True)
+        for player, rank, score in self.scorer.leaderboard.ranks():
+            connection = self.clients.get(player)
+            if connection is None or self.sent_ranks.get(player) == (rank, score):
+                continue
+            self.sent_ranks[player] = (rank, score)
+            connection.send(self.rank_message(rank, score), droppable=True)
+
+    def send_leaderboard(self, connection):
+        """Current standings for a player who just joined, asked to resync or fell behind"""
+        connection.send(OutboundMessage(self.leaderboard_message()))
+        rank = self.scorer.leaderboard.rank(connection.name)
+        if rank is not None:
+            score = self.scorer.leaderboard.score(connection.name)
+            self.sent_ranks[connection.name] = (rank, score)
+            connection.send(self.rank_message(rank, score))
+
+    # ---- Image prefetch ---------------------------------------------------
+
+    def upcoming_image_hashes(self):
+        """Distinct image hashes of the questions not yet shown, in quiz order"""
+        upcoming = []
+        for question in self.questions[self.current_question:]:
+            digest = question.get("image_hash")
+            if digest and digest not in upcoming:
+                upcoming.append(digest)
+            if self.prefetch_ahead is not None and len(upcoming) >= self.prefetch_ahead:
+                break
+        return upcoming
+
+    def send_prefetch(self, connection=None):
+        """Tell one player (or everyone) which images to download in the background"""
+        self.prefetch_hashes = self.upcoming_image_hashes()
+        message = {"type": "prefetch", "hashes": self.prefetch_hashes}
+        if connection is None:
+            self.broadcast(message)
+        else:
+            connection.send(OutboundMessage(message))
+        self.emit_prefetch_progress()
+
+    def mark_asset_ready(self, player_name, digest):
+        """Record a player's ack that an image is in their cache"""
+        if player_name not in self.clients or digest not in self.assets:
+            return
+        self.assets_ready.setdefault(player_name, set()).add(digest)
+        self.emit_prefetch_progress()
+
+    def emit_prefetch_progress(self):
+        wanted = set(self.prefetch_hashes)
+        ready_players = sum(
+            1 for player in self.clients
+            if wanted <= self.assets_ready.get(player, set())
+        )
+        self.emit("prefetch_progress",
+                  ready_players=ready_players,
+                  total_players=len(self.clients),
+                  images=len(wanted))
+
+    # ---- Question lifecycle ---------------------------------------------
+
+    def load_questions(self, questions):
+        self.questions = questions
+        self.current_question = 0
+        self.assets = {
+            question["image_hash"]: question["image"]
+            for question in questions
+            if question.get("image_hash")
+        }
+        for gateway in self.gateways:
+            gateway.send_assets()
+        if self.event_log and not self.recover(questions):
+            self.event_log.reset()
+            self.record("deck", self.deck_id)
+            self.record("timer", self.timer_mode, self.question_time)
+            # Players usually wait in the lobby before the deck is loaded
+            for token, player_name in self.sessions.items():
+                self.record("session", token, player_name)
+            for player_name in self.scorer.scores:
+                self.record("join", player_name)
+        self.send_prefetch()
+
+    def set_timer(self, timer_mode, question_time):
+        self.timer_mode = timer_mode
+        self.question_time = question_time
+        self.record("timer", timer_mode, question_time)
+
+    def start_quiz(self):
+        self.current_question = 0
+        self.quiz_ended = False
+        if self.answer_export:
+            self.answer_export.begin()
+        # Reset scores at the start of quiz
+        self.scorer.submit("reset")
+        self.send_prefetch()
+        self.send_next_question()
+
+    def cancel_timers(self):
+        """Stop the close and auto-advance timers of the current question"""
+        for handle in (self.close_timer, self.advance_timer):
+            if handle is not None:
+                handle.cancel()
+        self.close_timer = None
+        self.advance_timer = None
+        self.awaiting_grades = False
+        self.deadline = None
+
+    def send_next_question(self):
+        self.cancel_timers()
+        if self.current_question >= len(self.questions):
+            self.end_quiz()
+            return
+        # Reset tracking for new question; answers queued after this count for it
+        question_data = self.questions[self.current_question]
+        self.metrics.begin_question(self.current_question + 1)
+        self.metrics.trace("question_sent", players=len(self.clients))
+        self.scorer.submit("question", self.current_question, question_data, time.monotonic(),
+                           self.question_time if self.timer_mode else None, LATE_ANSWER_GRACE)
+        self.question_active = True
+        self.all_answered_sent = False
+        self.emit("question", number=self.current_question + 1, question=question_data)
+
+        # Enhanced question data with timer and question number
+        enhanced_data = {
+            "question": question_data["question"],
+            "type": question_data["type"],
+            "question_number": self.current_question + 1,
+            "total_questions": len(self.questions),
+            "timer_mode": self.timer_mode
+        }
+
+        if question_data["type"] == "multiple_choice":
+            enhanced_data["options"] = question_data["options"]
+        elif question_data["type"] == "short_answer":
+            enhanced_data["answer"] = question_data["answer"]
+
+        # Images are referenced by hash; clients fetch them on the asset channel
+        if question_data.get("image_hash"):
+            enhanced_data["image_hash"] = question_data["image_hash"]
+
+        if self.timer_mode:
+            # Clients count down to the same absolute deadline, corrected by their
+            # clock offset, so a late-arriving question does not buy extra time
+            self.deadline = time.time() + self.question_time
+            enhanced_data["time_limit"] = self.question_time
+            enhanced_data["deadline"] = self.deadline
+            self.close_timer = self.loop.call_later(self.question_time + LATE_ANSWER_GRACE,
+                                                    self.close_question)
+
+        self.question_message = enhanced_data
+        self.broadcast({
+            "type": "question",
+            "data": enhanced_data
+        })
+        self.current_question += 1
+        self.record("position", self.current_question, True)
+        # Slide the prefetch window so the next images download during this question
+        if self.prefetch_ahead is not None:
+            self.send_prefetch()
+
+    def close_question(self):
+        """Stop accepting answers for the current question and score them"""
+        if not self.question_active:
+            return
+        self.cancel_timers()
+        self.question_active = False
+        self.record("position", self.current_question, False)
+        self.metrics.trace("closed", answered=len(self.snapshot.answered),
+                           all_answered=self.all_answered_sent)
+        self.scorer.submit("close")
+        self.scorer.flush()
+        points = dict(self.scorer.last_points)
+        self.metrics.trace("scored", correct=len(points))
+        self.broadcast({
+            "type": "question_closed",
+            "question_number": self.current_question,
+            "points": points
+        })
+        if self.all_answered_sent:
+            self.emit("all_answered", question=self.scorer.question, top=self.snapshot.top)
+        self.emit("question_closed", number=self.current_question, points=points)
+        if self.timer_mode and self.auto_advance:
+            self.advance_timer = self.loop.call_later(self.advance_delay, self.advance_question)
+
+    def advance_question(self):
+        self.advance_timer = None
+        self.scorer.flush()
+        if self.snapshot.pending_answer:
+            # Short answers still need grading; move on once the last one is graded
+            self.awaiting_grades = True
+            return
+        self.send_next_question()
+
+    def restart_quiz(self):
+        # Reset quiz state
+        self.cancel_timers()
+        self.current_question = 0
+        self.question_active = False
+        self.record("position", 0, False)
+        self.scorer.submit("reset")
+        self.scorer.flush()
+        self.broadcast_scores()
+
+        # Send reset notification to all clients
+        self.broadcast({
+            "type": "restart",
+            "timer_reset": True
+        })
+        self.send_prefetch()
+
+    def end_quiz(self):
+        self.cancel_timers()
+        self.question_active = False
+        self.quiz_ended = True
+        self.record("ended")
+        self.scorer.submit("close")
+        # Apply answers still in the queue so the final scores are complete
+        self.scorer.flush()
+        self.broadcast_scores()
+        self.broadcast(dict(self.leaderboard_message(), type="end"))
+        self.emit("quiz_ended", scores=self.snapshot.scores)
+        if self.answer_export:
+            # Grades given after the end are no longer exported: count the rest as ungraded
+            self.scorer.export_ungraded()
+            self.loop.create_task(self.answer_export.finish())
+        self.metrics.end_question()
+        if self.metrics_path:
+            self.write_metrics()
+
+    # ---- Write-ahead log ----------------------------------------------------
+
+    def record(self, kind, *args):
+        """Append a state change to the write-ahead log, if there is one"""
+        # Until a deck is loaded the log still belongs to the quiz that loading
+        # it may recover; load_questions() records the lobby once it decided
+        if self.event_log and self.deck_id is not None:
+            self.event_log.append(kind, *args)
+
+    def log_score_command(self, command, args):
+        """Called by the ScoreKeeper for every command it applied"""
+        if command == "question":
+            # The question itself is in the deck; the first argument is its index
+            args = (args[0], None) + tuple(args[2:])
+        self.record(command, *args)
+
+    def log_state(self):
+        """Everything a log snapshot has to hold"""
+        return {
+            "engine": {
+                "deck": self.deck_id,
+                "current_question": self.current_question,
+                "question_active": self.question_active,
+                "timer_mode": self.timer_mode,
+                "question_time": self.question_time,
+                "sessions": self.sessions,
+                "ended": self.quiz_ended
+            },
+            "scorer": self.scorer.dump_state()
+        }
+
+    def recover(self, questions):
+        """
+        Pick up a quiz the log shows was interrupted while playing this deck.
+        Returns False, leaving the engine untouched, if there is none.
+        """
+        self.deck_id = deck_fingerprint(questions)
+        snapshot, records = self.event_log.load()
+        state = dict(snapshot["engine"]) if snapshot else {
+            "deck": None, "current_question": 0, "question_active": False,
+            "timer_mode": self.timer_mode, "question_time": self.question_time,
+            "sessions": {}, "ended": False
+        }
+        score_records = []
+        for kind, *args in records:
+            if kind == "deck":
+                state["deck"] = args[0]
+            elif kind == "timer":
+                state["timer_mode"], state["question_time"] = args
+            elif kind == "position":
+                state["current_question"], state["question_active"] = args
+                state["ended"] = False
+            elif kind == "ended":
+                state["ended"] = True
+            elif kind == "session":
+                state["sessions"][args[0]] = args[1]
+            elif kind == "session_end":
+                state["sessions"] = {token: name for token, name in state["sessions"].items()
+                                     if name != args[0]}
+            else:
+                score_records.append((kind, args))
+        if state["deck"] != self.deck_id or state["ended"] or not state["current_question"]:
+            return False
+
+        self.timer_mode = state["timer_mode"]
+        self.question_time = state["question_time"]
+        self.current_question = state["current_question"]
+        self.quiz_ended = False
+        lobby = list(self.scorer.scores)  # joined before the deck was loaded again
+        # Replayed commands are already logged, and their answers already exported
+        log, self.scorer.log = self.scorer.log, None
+        export, self.scorer.export = self.scorer.export, None
+        if snapshot:
+            self.scorer.load_state(snapshot["scorer"], questions)
+        for kind, args in score_records:
+            if kind == "question":
+                args = [args[0], questions[args[0]]] + args[2:]
+            self.scorer.apply(kind, args)
+        for player_name in lobby:
+            if player_name not in self.scorer.scores:
+                self.scorer.apply("join", (player_name,))
+        self.scorer.log = log
+        self.scorer.export = export
+        if self.answer_export:
+            self.answer_export.begin()  # the rest of the quiz goes to a new folder
+        if self.scorer.question_active:
+            # Its countdown cannot be resumed fairly after the downtime:
+            # score what arrived in time and carry on with the next question
+            self.scorer.apply("close", ())
+        self.question_active = False
+
+        # Everybody counts as dropped and may resume with their session token;
+        # whoever joined afresh meanwhile keeps the token they were given
+        live = set(self.sessions.values())
+        sessions = {token: name for token, name in state["sessions"].items() if name not in live}
+        sessions.update(self.sessions)
+        self.sessions = sessions
+        self.session_tokens = {name: token for token, name in self.sessions.items()}
+        for player_name in self.scorer.scores:
+            if (player_name in self.session_tokens and player_name not in self.clients
+                    and player_name not in self.disconnected):
+                self.disconnected[player_name] = self.loop.call_later(
+                    self.recovery_grace, self.expire_session, player_name)
+        self.scorer.publish()
+        # The merged state is in neither the log nor the snapshot: start both over from it
+        self.event_log.compact(self.log_state())
+        print(f"Recovered quiz at question {self.current_question}/{len(questions)} "
+              f"with {len(self.scorer.scores)} players from {self.event_log.path}")
+        self.emit("recovered", question=self.current_question, total=len(questions),
+                  timer_mode=self.timer_mode, question_time=self.question_time)
+        if self.timer_mode and self.auto_advance:
+            self.advance_timer = self.loop.call_later(self.advance_delay, self.advance_question)
+        return True
+
+    # ---- Host commands, applied by the score keeper --------------------------
+
+    def grade_answer(self, is_correct):
+        self.scorer.submit("grade", is_correct)
+
+    def adjust_score(self, player, amount):
+        """Adjust a player's score by the given amount"""
+        self.scorer.submit("adjust", player, amount)
+
+    def set_score(self, player, new_score):
+        """Set a player's score manually"""
+        self.scorer.submit("set", player, new_score)
@@ -0,0 +1,147 @@
+# room_server.py
+import asyncio
+import secrets
+import threading
+import os
+import sys
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import encode_message, hello_room, make_rejected
+from quiz_engine import QuizEngine, read_hello
+
+ROOM_CODE_ALPHABET = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"  # no 0/O or 1/I to misread
+ROOM_CODE_LENGTH = 5
+
+
+class RoomServer:
+    """
+    Many quizzes behind one listening socket.
+
+    Each room is a QuizEngine attached to the server's one event loop, with
+    its own players, deck, scores and timers. A new connection names its
+    room in the hello and is handed to that room's engine; unknown codes are
+    rejected. A room waiting on players or timers costs nothing but its
+    state, so one process hosts dozens of games. Decks loaded through the
+    shared deck_cache are held in memory once for every room playing them.
+    """
+
+    def __init__(self, host='0.0.0.0', port=5000, backlog=4096, deck_cache=None, **room_options):
+        self.host = host
+        self.port = port
+        self.backlog = backlog
+        self.deck_cache = deck_cache
+        self.room_options = room_options  # QuizEngine settings every room starts from
+        self.rooms = {}  # room code -> QuizEngine
+        self.loop = None
+        self.server = None
+        self.thread = None
+        self.startup_error = None
+
+    # ---- Thread bridge -------------------------------------------------
+
+    def start(self):
+        """Start the shared event loop in a background thread and begin listening"""
+        ready = threading.Event()
+        self.thread = threading.Thread(target=self._run, args=(ready,))
+        self.thread.daemon = True
+        self.thread.start()
+        ready.wait()
+        if self.startup_error:
+            raise self.startup_error
+
+    def _run(self, ready):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(
+                self.handle_connection, self.host, self.port,
+                backlog=self.backlog, reuse_address=True))
+        except Exception as e:
+            self.startup_error = e
+            ready.set()
+            return
+        print(f"Room server started on {self.host}:{self.port}")
+        ready.set()
+        self.loop.run_forever()
+        # Same wind-down as a standalone engine, across every room
+        connection_tasks = [task for room in self.rooms.values() for task in room.connection_tasks]
+        if connection_tasks:
+            self.loop.run_until_complete(asyncio.wait(connection_tasks, timeout=1))
+        tasks = asyncio.all_tasks(self.loop)
+        for task in tasks:
+            task.cancel()
+        self.loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+        self.loop.close()
+
+    def call(self, func, *args):
+        """Schedule func(*args) on the shared loop from any thread"""
+        self.loop.call_soon_threadsafe(func, *args)
+
+    def stop(self):
+        """Close every room and the listening socket, then stop the loop"""
+        if self.loop and self.loop.is_running():
+            self.loop.call_soon_threadsafe(self._shutdown)
+            self.thread.join(timeout=5)
+
+    def _shutdown(self):
+        if self.server:
+            self.server.close()
+        for room in self.rooms.values():
+            room.detach()
+        self.loop.stop()
+
+    # ---- Rooms ----------------------------------------------------------
+
+    def new_code(self):
+        while True:
+            code = "".join(secrets.choice(ROOM_CODE_ALPHABET) for _ in range(ROOM_CODE_LENGTH))
+            if code not in self.rooms:
+                return code
+
+    def create_room(self, code=None, questions=None, **options):
+        """
+        Open a room and return its engine, whose room attribute holds the
+        code players join with. Call from any thread but the loop's own;
+        options override the server-wide room settings.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.open_room(code, questions, options), self.loop)
+        return future.result()
+
+    async def open_room(self, code, questions, options):
+        code = code.strip().upper() if code else self.new_code()
+        if code in self.rooms:
+            raise ValueError(f"Room {code} already exists")
+        engine = QuizEngine(self.host, self.port, **{**self.room_options, **options})
+        engine.room = code
+        engine.attach(self.loop)
+        if questions is not None:
+            engine.load_questions(questions)
+        self.rooms[code] = engine
+        print(f"Opened room {code}")
+        return engine
+
+    def close_room(self, code):
+        """Disconnect a room's players and forget it; safe from any thread"""
+        self.call(self.remove_room, code)
+
+    def remove_room(self, code):
+        engine = self.rooms.pop(code, None)
+        if engine is not None:
+            engine.detach()
+            print(f"Closed room {code}")
+
+    # ---- Connections ----------------------------------------------------
+
+    async def handle_connection(self, reader, writer):
+        hello, player_name = await read_hello(reader, writer)
+        if hello is None:
+            return
+        code = hello_room(hello)
+        room = self.rooms.get(code)
+        if room is None:
+            reason = f"Unknown room code {code}" if code else "Room code is required"
+            print(f"Rejected {player_name}: {reason}")
+            writer.write(encode_message(make_rejected(reason)))
+            writer.close()
+            return
+        await room.accept(hello, player_name, reader, writer)
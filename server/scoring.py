@@ -0,0 +1,307 @@
+# scoring.py
+import asyncio
+import time
+from collections import namedtuple
+from types import MappingProxyType
+from leaderboard import Leaderboard
+
+MAX_POINTS = 1000  # an instant correct answer
+MIN_POINTS_RATIO = 0.5  # a correct answer right at the time limit still earns half
+STREAK_BONUS = 100  # extra points per correct answer in a row before this one
+MAX_STREAK_BONUS = 500
+
+# Immutable view of the game state, safe to hand to the UI thread or to
+# serialize for a broadcast while the score keeper keeps running
+ScoreSnapshot = namedtuple("ScoreSnapshot", ["version", "scores", "answered", "pending_answer", "top"])
+
+
+def answer_points(elapsed, time_limit, streak=0):
+    """Points for a correct answer given after elapsed seconds, with a streak bonus"""
+    if time_limit:
+        ratio = min(max(elapsed / time_limit, 0.0), 1.0)
+        points = MAX_POINTS * (1 - ratio * (1 - MIN_POINTS_RATIO))
+    else:
+        points = MAX_POINTS  # untimed questions do not reward speed
+    return round(points) + min(streak * STREAK_BONUS, MAX_STREAK_BONUS)
+
+
+class ScoreKeeper:
+    """
+    Single writer for scores, answered players and pending short answers.
+
+    Reader tasks and host commands never touch that state directly; they
+    submit commands to a queue. The keeper applies a whole burst of queued
+    commands in order and then publishes one ScoreSnapshot, so a hundred
+    answers arriving together cost one snapshot and one broadcast instead
+    of a hundred.
+
+    Answers are only recorded with their server receive time while the
+    question is open; points are worked out for all of them at once when
+    the question closes.
+
+    Commands depend on nothing but their arguments, so with a log callback
+    every applied command is recorded, and replaying the records through
+    apply() rebuilds the same state after a crash.
+    """
+
+    def __init__(self, on_publish, leaderboard_size=10, metrics=None, log=None, export=None):
+        self.on_publish = on_publish  # callback(snapshot, changed) on the loop thread
+        self.metrics = metrics
+        self.log = log  # callback(command, args) for each applied command
+        self.export = export  # callback(row) for each answer once it is scored
+        self.leaderboard_size = leaderboard_size  # entries in the snapshot's top list
+        self.queue = asyncio.Queue()
+        self.scores = {}
+        self.leaderboard = Leaderboard()  # kept in step with scores
+        self.answered = set()
+        self.pending_answers = {}  # answer key -> answer data, graded in arrival order
+        self.answers = {}  # player -> (answer, monotonic receive time) for the open question
+        self.streaks = {}  # player -> correct answers in a row
+        self.last_points = {}  # player -> points awarded when the last question closed
+        self.question = None
+        self.question_num = None
+        self.question_active = False
+        self.opened_at = None  # monotonic time the question was sent
+        self.time_limit = None  # seconds, None for untimed questions
+        self.closes_at = None  # monotonic time after which answers are ignored
+        self.version = 0
+        self.changed = set()
+        self.snapshot = self.make_snapshot()
+
+    def submit(self, command, *args):
+        """Queue a command; must be called on the engine loop"""
+        self.queue.put_nowait((command, args))
+
+    async def run(self):
+        while True:
+            command, args = await self.queue.get()
+            self.apply(command, args)
+            self.flush()
+
+    def flush(self):
+        """Apply everything queued so far and publish if anything changed"""
+        while not self.queue.empty():
+            self.apply(*self.queue.get_nowait())
+        if self.changed:
+            self.publish()
+
+    def apply(self, command, args):
+        try:
+            getattr(self, f"on_{command}")(*args)
+        except Exception as e:
+            print(f"Error applying {command}: {str(e)}")
+            return
+        if self.log:
+            self.log(command, args)
+
+    def dump_state(self):
+        """Everything the commands have built up, as JSON-ready data; the question is left to the deck"""
+        return {
+            "scores": self.scores,
+            "streaks": self.streaks,
+            "answered": sorted(self.answered),
+            "pending_answers": self.pending_answers,
+            "answers": self.answers,
+            "last_points": self.last_points,
+            "question_num": self.question_num,
+            "question_active": self.question_active,
+            "opened_at": self.opened_at,
+            "time_limit": self.time_limit,
+            "closes_at": self.closes_at
+        }
+
+    def load_state(self, state, questions):
+        """Restore dump_state() output against the same deck"""
+        self.scores = {}
+        self.leaderboard = Leaderboard()
+        for player, score in state["scores"].items():
+            self.set_score(player, score)
+        self.streaks = dict(state["streaks"])
+        self.answered = set(state["answered"])
+        self.pending_answers = dict(state["pending_answers"])
+        self.answers = {player: tuple(answer) for player, answer in state["answers"].items()}
+        self.last_points = dict(state["last_points"])
+        self.question_num = state["question_num"]
+        self.question = questions[self.question_num] if self.question_num is not None else None
+        self.question_active = state["question_active"]
+        self.opened_at = state["opened_at"]
+        self.time_limit = state["time_limit"]
+        self.closes_at = state["closes_at"]
+        self.changed.update(("scores", "answered", "pending"))
+
+    def make_snapshot(self):
+        pending = None
+        if self.pending_answers:
+            pending = dict(self.pending_answers[next(iter(self.pending_answers))])
+        return ScoreSnapshot(self.version,
+                             MappingProxyType(dict(self.scores)),
+                             frozenset(self.answered),
+                             pending,
+                             tuple(self.leaderboard.top(self.leaderboard_size)))
+
+    def publish(self):
+        self.version += 1
+        self.snapshot = self.make_snapshot()
+        changed, self.changed = self.changed, set()
+        self.on_publish(self.snapshot, changed)
+
+    # ---- Commands ---------------------------------------------------------
+
+    def set_score(self, player, score):
+        """Every score change goes through here so the leaderboard stays in order"""
+        self.scores[player] = score
+        self.leaderboard.update(player, score)
+        self.changed.add("scores")
+
+    def on_join(self, player):
+        self.set_score(player, 0)
+        self.streaks[player] = 0
+        self.changed.update(("scores", "answered"))
+
+    def on_leave(self, player):
+        self.scores.pop(player, None)
+        self.leaderboard.remove(player)
+        self.streaks.pop(player, None)
+        self.answers.pop(player, None)
+        self.answered.discard(player)
+        self.changed.update(("scores", "answered"))
+
+    def on_reset(self):
+        """Zero all scores and drop the current question's answers"""
+        for player in self.scores:
+            self.set_score(player, 0)
+            self.streaks[player] = 0
+        self.question_active = False
+        self.answers.clear()
+        self.last_points = {}
+        self.answered.clear()
+        self.pending_answers.clear()
+        self.changed.update(("scores", "answered", "pending"))
+
+    def on_question(self, question_num, question, opened_at, time_limit=None, grace=0):
+        """Open a new question; clears answers left over from the previous one"""
+        if self.question_active:
+            self.on_close()  # score the previous question if nobody closed it
+        self.export_ungraded()
+        self.question = question
+        self.question_num = question_num
+        self.question_active = True
+        self.opened_at = opened_at
+        self.time_limit = time_limit
+        self.closes_at = opened_at + time_limit + grace if time_limit else None
+        self.answers.clear()
+        self.answered.clear()
+        self.pending_answers.clear()
+        self.changed.update(("answered", "pending"))
+
+    def on_close(self):
+        """Stop accepting answers and score them; pending short answers can still be graded"""
+        if not self.question_active:
+            return
+        started = time.perf_counter()
+        self.question_active = False
+        question = self.question
+        self.last_points = {}
+        for player in self.scores:
+            if player not in self.answers:
+                self.streaks[player] = 0
+                continue
+            answer, received = self.answers[player]
+            if question["type"] == "short_answer":
+                continue  # Scored when the host grades it; the streak waits for the grade
+            correct = answer == question["correct"]
+            if correct:
+                self.award(player, received - self.opened_at)
+            else:
+                self.streaks[player] = 0
+            self.export_answer(player, answer, received - self.opened_at, correct)
+        self.answers.clear()
+        if self.metrics:
+            self.metrics.observe("question_scoring_seconds", time.perf_counter() - started)
+
+    def on_answer(self, player, answer_data, received):
+        """Record an answer and when it arrived; scoring waits for the close"""
+        if not self.question_active or player not in self.scores or player in self.answered:
+            return  # Ignore answers when no question is active, or repeats
+        if self.closes_at is not None and received > self.closes_at:
+            return  # Arrived after the deadline, even if the close is still queued
+        if not isinstance(answer_data, dict) or answer_data.get("type") != self.question["type"]:
+            return
+
+        if self.metrics:
+            # Time from the socket read to the answer being recorded
+            self.metrics.observe("answer_processing_seconds", time.monotonic() - received)
+            self.metrics.inc("answers_recorded")
+
+        # Mark this client as having answered
+        answer = answer_data.get("answer")
+        self.answered.add(player)
+        self.answers[player] = (answer, received)
+        self.changed.add("answered")
+
+        if self.question["type"] == "short_answer":
+            # The host can start grading while the question is still open
+            self.pending_answers[f"{player}_{self.question_num}"] = {
+                "player": player,
+                "answer": answer,
+                "question_num": self.question_num,
+                "correct_answer": self.question["answer"],
+                "elapsed": received - self.opened_at
+            }
+            self.changed.add("pending")
+
+    def award(self, player, elapsed):
+        """Credit a correct answer and extend the player's streak"""
+        points = answer_points(elapsed, self.time_limit, self.streaks.get(player, 0))
+        self.streaks[player] = self.streaks.get(player, 0) + 1
+        self.set_score(player, self.scores[player] + points)
+        self.last_points[player] = points
+
+    def on_grade(self, is_correct):
+        if not self.pending_answers:
+            return
+
+        answer_key = next(iter(self.pending_answers))
+        answer_data = self.pending_answers.pop(answer_key)
+        self.changed.add("pending")
+
+        player = answer_data["player"]
+        if player not in self.scores:
+            return
+        if is_correct:
+            self.award(player, answer_data["elapsed"])
+        else:
+            self.streaks[player] = 0
+        self.export_answer(player, answer_data["answer"], answer_data["elapsed"], bool(is_correct))
+
+    def export_ungraded(self):
+        """Export the short answers still waiting for a grade, as ungraded"""
+        for answer_data in self.pending_answers.values():
+            self.export_answer(answer_data["player"], answer_data["answer"],
+                               answer_data["elapsed"], None)
+
+    def export_answer(self, player, answer, elapsed, correct):
+        """Hand one scored answer to the export; correct is None for ungraded ones"""
+        if not self.export:
+            return
+        self.export({
+            "question_number": self.question_num + 1,
+            "question_type": self.question["type"],
+            "player": player,
+            "answer": str(answer),
+            "latency_seconds": elapsed,
+            "correct": correct,
+            "points": self.last_points.get(player, 0) if correct else 0,
+            # Wall-clock time the answer arrived, from its offset into the question
+            "answered_at": time.time() - (time.monotonic() - self.opened_at - elapsed)
+        })
+
+    def on_adjust(self, player, amount):
+        """Adjust a player's score by the given amount"""
+        if player in self.scores:
+            self.set_score(player, self.scores[player] + amount)
+
+    def on_set(self, player, new_score):
+        """Set a player's score manually"""
+        if player in self.scores:
+            self.set_score(player, new_score)
@@ -1,18 +1,19 @@
 # server.py
-import socket
 import netifaces
 import threading
-import json
 import tkinter as tk
 from tkinter import messagebox
 from question_importer import QuestionImporter
+from deck_cache import DeckCache
+from answer_export import DEFAULT_EXPORT_DIR
+from ui_dispatcher import LineUpdater, UiDispatcher
+from quiz_engine import QuizEngine
 from tkinter import filedialog
 from tkinter import ttk
 import os
 import sys
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
 from utils import CustomStyle
-import base64
 from PIL import Image, ImageTk
 from io import BytesIO
 
@@ -49,24 +50,30 @@ def get_hamachi_ip():
         return None
     return None
 
+UI_REFRESH_HZ = 20  # upper bound on host UI redraws per second
+METRICS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics", "metrics.json")
+# Loading the same deck after a crash resumes the quiz from this log
+EVENT_LOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "state", "quiz.log")
+
 class QuizServer:
+    """Tk host view; sockets and game state live in QuizEngine"""
     def __init__(self):
         self.host = get_local_ip() or '0.0.0.0'  # Get the WiFi IP address
         self.port = 5000
-        self.server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.clients = {}
+        self.engine = QuizEngine(self.host, self.port, metrics_path=METRICS_PATH,
+                                 log_path=EVENT_LOG_PATH, export_path=DEFAULT_EXPORT_DIR)
+        # View copies of engine state, refreshed from engine events
+        self.players = []
         self.scores = {}
-        self.current_question = 0
+        self.top_scores = ()  # (player, score) pairs, best first
+        self.answered_clients = set()
         self.questions = []  # Will be loaded from Excel
         self.question_importer = QuestionImporter()
-        self.pending_answers = {} 
+        self.deck_cache = DeckCache(self.question_importer)
         # Get Hamachi IP if available
         self.hamachi_ip = get_hamachi_ip()
         self.timer_mode = False
         self.question_time = 30  # default 30 seconds
-        self.answered_clients = set()  # Track who has answered current question
-        self.question_active = False   # Track if a question is currently active
         self.setup_gui()
         
     def setup_gui(self):
@@ -171,6 +178,12 @@ class QuizServer:
                                     style="Custom.TLabel")
         self.players_label.pack(pady=5)
         
+        self.prefetch_label = ttk.Label(info_frame,
+                                    text="Images Ready: -",
+                                    font=("Helvetica", 12),
+                                    style="Custom.TLabel")
+        self.prefetch_label.pack(pady=5)
+        
         self.create_scrollable_area(main_frame)
       
     def create_scrollable_area(self, parent):
@@ -275,6 +288,9 @@ class QuizServer:
                                 bg="white",
                                 relief="solid")
         self.scores_text.pack(pady=5, fill=tk.BOTH, expand=True)
+        self.scores_lines = LineUpdater(self.scores_text)
+        self.scores_dirty = False
+        self.dropdown_players = []
         
         # Score adjustment controls in right column
         adjust_frame = ttk.Frame(right_column, style="Custom.TFrame")
@@ -301,14 +317,14 @@ class QuizServer:
         adjust_buttons_frame.pack(pady=5)
         
         ttk.Button(adjust_buttons_frame,
-                text="-1",
+                text="-100",
                 style="Custom.TButton",
-                command=lambda: self.adjust_score(-1)).pack(side=tk.LEFT, padx=2)
+                command=lambda: self.adjust_score(-100)).pack(side=tk.LEFT, padx=2)
         
         ttk.Button(adjust_buttons_frame,
-                text="+1",
+                text="+100",
                 style="Custom.TButton",
-                command=lambda: self.adjust_score(1)).pack(side=tk.LEFT, padx=2)
+                command=lambda: self.adjust_score(100)).pack(side=tk.LEFT, padx=2)
         
         # Manual score entry
         manual_frame = ttk.Frame(adjust_frame, style="Custom.TFrame")
@@ -354,9 +370,7 @@ class QuizServer:
         """Adjust selected player's score by the given amount"""
         player = self.player_var.get()
         if player in self.scores:
-            self.scores[player] += amount
-            self.update_scores_display()
-            self.broadcast_scores()
+            self.engine.call(self.engine.adjust_score, player, amount)
 
     def set_manual_score(self):
         """Set a player's score manually"""
@@ -364,19 +378,11 @@ class QuizServer:
         try:
             new_score = int(self.score_entry.get())
             if player in self.scores:
-                self.scores[player] = new_score
-                self.update_scores_display()
-                self.broadcast_scores()
+                self.engine.call(self.engine.set_score, player, new_score)
         except ValueError:
             messagebox.showerror("Error", "Please enter a valid number")
 
     def restart_quiz(self):
-        # Reset quiz state
-        self.current_question = 0
-        self.question_active = False
-        self.answered_clients.clear()
-        self.pending_answers.clear()
-
         # Reset timer-related state
         if self.timer_mode:
             try:
@@ -385,24 +391,9 @@ class QuizServer:
                 self.question_time = 30
                 self.time_entry.delete(0, tk.END)
                 self.time_entry.insert(0, "30")
+            self.engine.call(self.engine.set_timer, self.timer_mode, self.question_time)
 
-        for player in self.scores:
-            self.scores[player] = 0
-        self.update_scores_display()
-        self.update_answered_status()
-        
-        # Send reset notification to all clients
-        message = json.dumps({
-            "type": "restart",
-            "data": self.scores,
-            "timer_reset": True 
-        })
-        
-        for client in self.clients.values():
-            try:
-                client.send(message.encode())
-            except:
-                continue
+        self.engine.call(self.engine.restart_quiz)
         
         # Reset UI state
         self.start_button.config(state=tk.NORMAL)
@@ -420,18 +411,14 @@ class QuizServer:
                 self.question_time = 30
                 self.time_entry.delete(0, tk.END)
                 self.time_entry.insert(0, "30")
+        self.engine.call(self.engine.set_timer, self.timer_mode, self.question_time)
 
     def send_next_question(self):
-        if self.current_question >= len(self.questions):
-            self.end_quiz()
-            return
-        # Reset tracking for new question
-        self.answered_clients.clear()
-        self.pending_answers.clear()
-        self.question_active = True
-            
-        question_data = self.questions[self.current_question]
-        self.question_label.config(text=f"Question {self.current_question + 1}: {question_data['question']}")
+        self.engine.call(self.engine.send_next_question)
+
+    def show_question(self, number, question_data):
+        """Display the question the engine just sent to players"""
+        self.question_label.config(text=f"Question {number}: {question_data['question']}")
 
         # Handle multiple choice options display
         if question_data["type"] == "multiple_choice":
@@ -445,25 +432,11 @@ class QuizServer:
         else:
             self.options_frame.pack_forget()
 
-        # Handle image display if present
-        if "image" in question_data and question_data["image"]:
+        # Show the pre-scaled preview rendition, no resizing at show time
+        preview = question_data.get("thumbnail") or question_data.get("image")
+        if preview:
             try:
-                # Clear any existing image
-                self.image_label.config(image='')
-                
-                # Decode and display image
-                image_data = base64.b64decode(question_data["image"])
-                image = Image.open(BytesIO(image_data))
-                
-                # Calculate new dimensions while maintaining aspect ratio
-                max_width = 800
-                max_height = 600
-                ratio = min(max_width/image.width, max_height/image.height)
-                new_width = int(image.width * ratio)
-                new_height = int(image.height * ratio)
-                
-                image = image.resize((new_width, new_height), Image.LANCZOS)
-                photo = ImageTk.PhotoImage(image)
+                photo = ImageTk.PhotoImage(Image.open(BytesIO(preview)))
                 self.image_label.config(image=photo)
                 self.image_label.image = photo  # Keep a reference!
             except Exception as e:
@@ -472,162 +445,41 @@ class QuizServer:
         else:
             self.image_label.config(image='')
 
-        self.update_answered_status()
-
-        # Enhanced question data with timer and question number
-        enhanced_data = {
-            "question": question_data["question"],
-            "type": question_data["type"],
-            "question_number": self.current_question + 1,
-            "total_questions": len(self.questions),
-            "timer_mode": self.timer_mode
-        }
-        
-        if question_data["type"] == "multiple_choice":
-            enhanced_data["options"] = question_data["options"]
-        elif question_data["type"] == "short_answer":
-            enhanced_data["answer"] = question_data["answer"]
-            
-         # Handle image if present - just pass through the already encoded image data
-        if "image" in question_data and question_data["image"]:
-            print(f"Server: Found image data for question {self.current_question + 1}")
-            enhanced_data["image"] = question_data["image"]
-            
-        if self.timer_mode:
-            enhanced_data["time_limit"] = self.question_time
-            
-        # Send question to all clients
-        message = json.dumps({
-            "type": "question",
-            "data": enhanced_data
-        })
-        
-        for client in self.clients.values():
-            try:
-                client.send(message.encode())
-            except:
-                continue
-                
-        self.current_question += 1
-
-    # Add method to update the answered status display:
-    def update_answered_status(self):
-        status_text = "\nAnswered Players:\n"
-        for player in self.clients.keys():
-            status = "✓" if player in self.answered_clients else "..."
-            status_text += f"{player}: {status}\n"
-        
-        # Update the scores text to include who has answered
-        self.scores_text.delete(1.0, tk.END)
-        for player, score in self.scores.items():
-            self.scores_text.insert(tk.END, f"{player}: {score}\n")
-        self.scores_text.insert(tk.END, status_text)
-
-    # Update process_answer method:
-    def process_answer(self, player_name, answer_data):
-        """Process answer from client with type checking"""
-        if not self.question_active:
-            return  # Ignore answers when no question is active
-            
-        try:
-            question = self.questions[self.current_question - 1]
-            
-            # Ensure answer_data is properly formatted
-            if not isinstance(answer_data, dict):
-                answer_data = json.loads(answer_data)
-                
-            # Mark this client as having answered
-            self.answered_clients.add(player_name)
-            self.update_answered_status()
-                
-            answer_type = answer_data.get("type")
-            answer = answer_data.get("answer")
-            
-            if answer_type == "multiple_choice" and question["type"] == "multiple_choice":
-                if answer == question["correct"]:
-                    self.scores[player_name] += 1
-                    self.update_scores_display()
-                    self.broadcast_scores()
-                    
-                # Check if all clients have answered
-                if len(self.answered_clients) == len(self.clients):
-                    self.show_answer_summary(question)
-                    
-            elif answer_type == "short_answer" and question["type"] == "short_answer":
-                answer_key = f"{player_name}_{self.current_question - 1}"
-                self.pending_answers[answer_key] = {
-                    "player": player_name,
-                    "answer": answer,
-                    "question_num": self.current_question - 1
-                }
-                self.show_next_pending_answer()
-                
-                # Check if all clients have answered
-                if len(self.answered_clients) == len(self.clients):
-                    self.next_button.config(state=tk.NORMAL)
-                    messagebox.showinfo("All Answered", "All players have submitted their answers!")
-                    
-        except Exception as e:
-            print(f"Error processing answer: {str(e)}")
-    
-    # Add method to show answer summary for multiple choice:
-    def show_answer_summary(self, question):
+    # Add method to show answer summary once everyone has answered:
+    def show_answer_summary(self, question, top):
         if question["type"] == "multiple_choice":
             correct_option = question["options"][question["correct"]]
-            summary = f"All players have answered!\n\nCorrect answer: {correct_option}\n\nCurrent scores:"
-            for player, score in self.scores.items():
-                summary += f"\n{player}: {score}"
+            summary = f"All players have answered!\n\nCorrect answer: {correct_option}\n\nLeaderboard:"
+            for rank, (player, score) in enumerate(top, start=1):
+                summary += f"\n{rank}. {player}: {score}"
             
             self.next_button.config(state=tk.NORMAL)
             messagebox.showinfo("Question Complete", summary)
-            
-    # Add a method to broadcast scores:
-    def broadcast_scores(self):
-        """Send updated scores to all clients"""
-        message = json.dumps({
-            "type": "score_update",
-            "data": self.scores
-        })
-        
-        for client in self.clients.values():
-            try:
-                client.send(message.encode())
-            except:
-                continue
+        else:
+            self.next_button.config(state=tk.NORMAL)
+            messagebox.showinfo("All Answered", "All players have submitted their answers!")
 
-    def show_next_pending_answer(self):
-        if not self.pending_answers:
+    def show_pending_answer(self, answer_data):
+        if not answer_data:
             self.answer_text.delete(1.0, tk.END)
             self.answer_text.insert(tk.END, "No pending answers to grade")
             self.correct_button.config(state=tk.DISABLED)
             self.incorrect_button.config(state=tk.DISABLED)
             return
-            
-        answer_key = next(iter(self.pending_answers))
-        answer_data = self.pending_answers[answer_key]
         
         self.answer_text.delete(1.0, tk.END)
         self.answer_text.insert(tk.END, f"Player: {answer_data['player']}\n")
         self.answer_text.insert(tk.END, f"Answer: {answer_data['answer']}\n")
-        self.answer_text.insert(tk.END, f"Correct Answer: {self.questions[answer_data['question_num']]['answer']}")
+        self.answer_text.insert(tk.END, f"Correct Answer: {answer_data['correct_answer']}")
         
         self.correct_button.config(state=tk.NORMAL)
         self.incorrect_button.config(state=tk.NORMAL)
         
     def grade_answer(self, is_correct):
-        if not self.pending_answers:
-            return
-            
-        answer_key = next(iter(self.pending_answers))
-        answer_data = self.pending_answers[answer_key]
-        
-        if is_correct:
-            self.scores[answer_data['player']] += 1
-            
-        del self.pending_answers[answer_key]
-        self.update_scores_display()
-        self.broadcast_scores()
-        self.show_next_pending_answer()
+        # Disable grading until the engine sends the next pending answer
+        self.correct_button.config(state=tk.DISABLED)
+        self.incorrect_button.config(state=tk.DISABLED)
+        self.engine.call(self.engine.grade_answer, is_correct)
 
     def load_questions(self):
         try:
@@ -637,70 +489,104 @@ class QuizServer:
             )
             
             if file_path:
-                self.questions = self.question_importer.load_questions(file_path)
-                self.question_count_label.config(text=f"Loaded Questions: {len(self.questions)}")
-                messagebox.showinfo("Success", f"Loaded {len(self.questions)} questions")
+                # Build or open the compiled deck off the Tk thread
+                self.load_button.config(state=tk.DISABLED)
+                self.question_count_label.config(text="Loading questions...")
+                load_thread = threading.Thread(target=self.load_deck, args=(file_path,))
+                load_thread.daemon = True
+                load_thread.start()
         except Exception as e:
             messagebox.showerror("Error", str(e))
 
+    def load_deck(self, file_path):
+        """Runs in a worker thread; reports back through the engine event queue"""
+        try:
+            questions = self.deck_cache.load(file_path)
+            self.engine.events.put(("questions_loaded", {"questions": questions}))
+        except Exception as e:
+            self.engine.events.put(("load_error", {"message": str(e)}))
+
     def start_server(self):
         try:
-            self.server_socket.bind((self.host, self.port))
-            self.server_socket.listen(4)
-            print(f"Server started on {self.host}:{self.port}")
-            
-            # Start accepting clients in a separate thread
-            accept_thread = threading.Thread(target=self.accept_clients)
-            accept_thread.daemon = True
-            accept_thread.start()
-            
-            self.window.mainloop()
+            self.engine.start()
         except Exception as e:
             messagebox.showerror("Error", f"Could not start server: {str(e)}")
             self.window.destroy()
-        
-    def accept_clients(self):
-        while True:
-            client_socket, address = self.server_socket.accept()
-            # Get player name
-            player_name = client_socket.recv(1024).decode()
-            
-            self.clients[player_name] = client_socket
-            self.scores[player_name] = 0
-            
-            # Update GUI
-            self.players_label.config(text=f"Connected Players: {len(self.clients)}")
+            return
+
+        self.dispatcher = UiDispatcher(self.window, self.engine.events,
+                                       self.handle_engine_event,
+                                       flush=self.refresh_views,
+                                       refresh_hz=UI_REFRESH_HZ,
+                                       metrics=self.engine.metrics)
+        self.dispatcher.start()
+        self.window.mainloop()
+        self.engine.stop()
+
+    def refresh_views(self):
+        """Redraw views marked dirty by the events of one dispatcher tick"""
+        if self.scores_dirty:
+            self.scores_dirty = False
             self.update_scores_display()
-            
-            # Start a thread to handle this client
-            client_thread = threading.Thread(target=self.handle_client, args=(client_socket, player_name))
-            client_thread.daemon = True
-            client_thread.start()
-            
-    # Update handle_client method to handle disconnections:
-    def handle_client(self, client_socket, player_name):
-        while True:
-            try:
-                data = client_socket.recv(1024).decode()
-                if not data:
-                    break
-                    
-                answer = json.loads(data)
-                self.process_answer(player_name, answer)
-            except:
-                break
-                
-        # Clean up when client disconnects
-        del self.clients[player_name]
-        del self.scores[player_name]
-        self.answered_clients.discard(player_name)  # Remove from answered set
-        client_socket.close()
-        self.players_label.config(text=f"Connected Players: {len(self.clients)}")
-        self.update_scores_display()
-        self.update_answered_status()
+
+    def handle_engine_event(self, event, data):
+        if event == "players":
+            self.players = data["players"]
+            self.answered_clients = set(data["answered"])
+            self.players_label.config(text=f"Connected Players: {len(self.players)}")
+            self.scores_dirty = True
+        elif event == "questions_loaded":
+            self.questions = data["questions"]
+            self.engine.call(self.engine.load_questions, self.questions)
+            self.load_button.config(state=tk.NORMAL)
+            self.question_count_label.config(text=f"Loaded Questions: {len(self.questions)}")
+            messagebox.showinfo("Success", f"Loaded {len(self.questions)} questions")
+        elif event == "load_error":
+            self.load_button.config(state=tk.NORMAL)
+            self.question_count_label.config(text=f"Loaded Questions: {len(self.questions)}")
+            messagebox.showerror("Error", data["message"])
+        elif event == "prefetch_progress":
+            if data["images"]:
+                self.prefetch_label.config(
+                    text=f"Images Ready: {data['ready_players']}/{data['total_players']} players "
+                         f"({data['images']} images)")
+            else:
+                self.prefetch_label.config(text="Images Ready: -")
+        elif event == "scores":
+            self.scores = data["scores"]
+            self.top_scores = data["top"]
+            self.scores_dirty = True
+        elif event == "question":
+            self.show_question(data["number"], data["question"])
+        elif event == "pending_answer":
+            self.show_pending_answer(data["answer"])
+        elif event == "all_answered":
+            self.show_answer_summary(data["question"], data["top"])
+        elif event == "question_closed":
+            # Time is up (or everyone answered); late answers are now ignored
+            self.question_label.config(text=f"{self.question_label.cget('text')} (closed)")
+            self.next_button.config(state=tk.NORMAL)
+        elif event == "recovered":
+            self.timer_mode = data["timer_mode"]
+            self.question_time = data["question_time"]
+            self.timer_var.set(self.timer_mode)
+            self.time_entry.config(state=tk.NORMAL)
+            self.time_entry.delete(0, tk.END)
+            self.time_entry.insert(0, str(self.question_time))
+            self.time_entry.config(state=tk.NORMAL if self.timer_mode else tk.DISABLED)
+            self.start_button.config(state=tk.DISABLED)
+            self.next_button.config(state=tk.NORMAL)
+            self.restart_button.config(state=tk.NORMAL)
+            messagebox.showinfo("Quiz Resumed",
+                                f"Resumed the interrupted quiz after question {data['question']} "
+                                f"of {data['total']}. Players can reconnect now.")
+        elif event == "quiz_ended":
+            self.start_button.config(state=tk.NORMAL)
+            self.next_button.config(state=tk.DISABLED)
+            messagebox.showinfo("Quiz Ended", "The quiz has ended!")
         
     def start_quiz(self):
-        if len(self.clients) == 0:
+        if len(self.players) == 0:
             messagebox.showwarning("Warning", "No players connected!")
             return
             
@@ -716,40 +602,34 @@ class QuizServer:
                 self.time_entry.insert(0, "30")
                 return
                 
-        self.current_question = 0
-        # Reset scores at the start of quiz
-        for player in self.scores:
-            self.scores[player] = 0
-        self.update_scores_display()
-        
-        self.send_next_question()
+        self.engine.call(self.engine.set_timer, self.timer_mode, self.question_time)
+        self.engine.call(self.engine.start_quiz)
         self.start_button.config(state=tk.DISABLED)
         self.next_button.config(state=tk.NORMAL)
         self.restart_button.config(state=tk.NORMAL)
                 
     def update_scores_display(self):
-        """Update the scores display and dropdown"""
-        self.scores_text.delete(1.0, tk.END)
-        for player, score in self.scores.items():
-            self.scores_text.insert(tk.END, f"{player}: {score}\n")
-        
-        # Update player dropdown
-        self.player_dropdown['values'] = list(self.scores.keys())
+        """Update the scores and answered status display and the dropdown"""
+        # Only the top of the leaderboard is drawn, however big the room is
+        lines = [f"{rank}. {player}: {score}"
+                 for rank, (player, score) in enumerate(self.top_scores, start=1)]
+        if len(self.scores) > len(self.top_scores):
+            lines.append(f"... and {len(self.scores) - len(self.top_scores)} more")
+        lines.append("")
+        lines.append(f"Answered Players: {len(self.answered_clients)}/{len(self.players)}")
+        waiting = [player for player in self.players if player not in self.answered_clients]
+        if len(waiting) <= len(self.top_scores):
+            lines.extend(f"{player}: ..." for player in waiting)
+        # Only lines whose text changed are rewritten
+        self.scores_lines.set_lines(lines)
+        
+        # Update player dropdown when the set of players changes
+        players = list(self.scores.keys())
+        if players != self.dropdown_players:
+            self.dropdown_players = players
+            self.player_dropdown['values'] = players
         if not self.player_var.get() and self.scores:
-            self.player_var.set(list(self.scores.keys())[0])
-            
-    def end_quiz(self):
-        message = json.dumps({
-            "type": "end",
-            "data": self.scores
-        })
-        
-        for client in self.clients.values():
-            client.send(message.encode())
-            
-        self.start_button.config(state=tk.NORMAL)
-        self.next_button.config(state=tk.DISABLED)
-        messagebox.showinfo("Quiz Ended", "The quiz has ended!")
+            self.player_var.set(players[0])
 
 # Run server
 if __name__ == "__main__":
@@ -0,0 +1,87 @@
+# ui_dispatcher.py
+import queue
+import time
+import tkinter as tk
+
+# Events that describe current state: only the newest one per tick matters
+COALESCED_EVENTS = ("players", "scores", "pending_answer", "prefetch_progress")
+
+
+class UiDispatcher:
+    """
+    Apply engine events to Tk widgets from the Tk thread only.
+
+    Events are drained at a bounded refresh rate. State events are
+    coalesced so only the latest of each kind is applied per tick, while
+    one-shot events (a new question, quiz end, ...) are applied in order.
+    After each tick with events, flush() is called once so views can
+    redraw whatever was marked dirty. With metrics, each tick records how
+    late Tk ran it and how long applying the events took.
+    """
+
+    def __init__(self, window, events, handler, flush=None, refresh_hz=20,
+                 coalesced=COALESCED_EVENTS, metrics=None):
+        self.window = window
+        self.events = events
+        self.handler = handler
+        self.flush = flush
+        self.interval_ms = max(1, int(1000 / refresh_hz))
+        self.coalesced = coalesced
+        self.metrics = metrics
+        self.due = None  # monotonic time the next tick was scheduled for
+
+    def start(self):
+        self.schedule()
+
+    def schedule(self):
+        self.due = time.monotonic() + self.interval_ms / 1000
+        self.window.after(self.interval_ms, self.tick)
+
+    def tick(self):
+        started = time.monotonic()
+        latest = {}
+        ordered = []
+        try:
+            while True:
+                event, data = self.events.get_nowait()
+                if event in self.coalesced:
+                    latest[event] = data
+                else:
+                    ordered.append((event, data))
+        except queue.Empty:
+            pass
+
+        try:
+            for event, data in latest.items():
+                self.handler(event, data)
+            for event, data in ordered:
+                self.handler(event, data)
+            if (latest or ordered) and self.flush:
+                self.flush()
+        finally:
+            if self.metrics:
+                self.metrics.observe("ui_refresh_lag_seconds", max(0.0, started - self.due))
+                if latest or ordered:
+                    self.metrics.observe("ui_apply_seconds", time.monotonic() - started)
+                    self.metrics.inc("ui_events", len(latest) + len(ordered))
+            self.schedule()
+
+
+class LineUpdater:
+    """Keep a Text widget in sync with a list of lines, rewriting only changed lines"""
+
+    def __init__(self, text_widget):
+        self.text = text_widget
+        self.lines = []
+
+    def set_lines(self, lines):
+        if len(lines) != len(self.lines):
+            # Line count changed (player joined or left): rebuild once
+            self.text.delete(1.0, tk.END)
+            self.text.insert(tk.END, "\n".join(lines))
+        else:
+            for number, (old, new) in enumerate(zip(self.lines, lines), start=1):
+                if old != new:
+                    self.text.delete(f"{number}.0", f"{number}.end")
+                    self.text.insert(f"{number}.0", new)
+        self.lines = list(lines)
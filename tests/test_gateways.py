@@ -0,0 +1,26 @@
+# test_gateways.py
+import os
+import subprocess
+import sys
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench")))
+from bench_quiz import SERVER_ERROR_MARKERS
+
+BENCH = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "bench", "bench_quiz.py"))
+
+
+class GatewayRunTest(unittest.TestCase):
+    def test_quiz_through_two_gateways_ends_cleanly(self):
+        """A short quiz through gateways: every bot finishes and nothing is logged on stderr"""
+        result = subprocess.run(
+            [sys.executable, BENCH, "--players", "20", "--questions", "2", "--question-time", "2",
+             "--advance-delay", "0.5", "--gateways", "2", "--port", "5099"],
+            capture_output=True, text=True, timeout=120)
+        self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+        self.assertIn("finished: 20", result.stdout)
+        for marker in SERVER_ERROR_MARKERS:
+            self.assertNotIn(marker, result.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
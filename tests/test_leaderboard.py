@@ -0,0 +1,51 @@
+# test_leaderboard.py
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server")))
+from leaderboard import Leaderboard
+
+
+class LeaderboardTest(unittest.TestCase):
+    def board(self, *scores):
+        leaderboard = Leaderboard()
+        for player, score in scores:
+            leaderboard.update(player, score)
+        return leaderboard
+
+    def test_ties_go_to_who_got_there_first(self):
+        cases = [
+            # updates in order, expected top
+            ([("a", 10), ("b", 10), ("c", 10)], ["a", "b", "c"]),
+            ([("a", 10), ("b", 10), ("a", 20), ("a", 10)], ["b", "a"]),  # a came back to 10 later
+            ([("a", 10), ("b", 5), ("b", 10)], ["a", "b"]),
+            ([("a", 10), ("b", 10), ("a", 10)], ["a", "b"]),  # an unchanged score keeps its place
+        ]
+        for updates, order in cases:
+            with self.subTest(updates=updates):
+                leaderboard = self.board(*updates)
+                self.assertEqual([player for player, _ in leaderboard.top(10)], order)
+
+    def test_rank_after_update(self):
+        leaderboard = self.board(("a", 300), ("b", 200), ("c", 100))
+        self.assertEqual([leaderboard.rank(player) for player in "abc"], [1, 2, 3])
+        leaderboard.update("c", 250)
+        self.assertEqual([leaderboard.rank(player) for player in "abc"], [1, 3, 2])
+        leaderboard.update("a", 0)
+        self.assertEqual([leaderboard.rank(player) for player in "abc"], [3, 2, 1])
+        self.assertEqual(list(leaderboard.ranks()), [("c", 1, 250), ("b", 2, 200), ("a", 3, 0)])
+        self.assertEqual(leaderboard.score("c"), 250)
+
+    def test_remove(self):
+        leaderboard = self.board(("a", 300), ("b", 200), ("c", 100))
+        leaderboard.remove("b")
+        leaderboard.remove("nobody")
+        self.assertEqual(len(leaderboard), 2)
+        self.assertNotIn("b", leaderboard)
+        self.assertIsNone(leaderboard.rank("b"))
+        self.assertEqual(leaderboard.rank("c"), 2)
+        self.assertEqual(leaderboard.top(1), [("a", 300)])
+
+
+if __name__ == "__main__":
+    unittest.main()
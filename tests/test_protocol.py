@@ -0,0 +1,125 @@
+# test_protocol.py
+import asyncio
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from protocol import (CODECS, COMPRESSION_THRESHOLD, FLAG_COMPRESSED, HEADER, KIND_JSON,
+                      MAX_FRAME_SIZE, FrameReader, OutboundMessage, ProtocolError, choose_codec,
+                      encode_message, read_message_async)
+
+BIG_MESSAGE = {"type": "question", "data": "x" * (COMPRESSION_THRESHOLD * 4)}
+
+
+class ChunkedSocket:
+    """Hands out the bytes given to it a few at a time, like a slow TCP stream"""
+
+    def __init__(self, data, chunk=3):
+        self.data = memoryview(data)
+        self.chunk = chunk
+
+    def recv_into(self, view):
+        count = min(len(view), self.chunk, len(self.data))
+        view[:count] = self.data[:count]
+        self.data = self.data[count:]
+        return count
+
+
+def read_async(data, codec=None, count=1):
+    """Decode count messages from data fed to a StreamReader in small pieces"""
+    async def read():
+        stream = asyncio.StreamReader()
+        for start in range(0, len(data), 5):
+            stream.feed_data(data[start:start + 5])
+        stream.feed_eof()
+        return [await read_message_async(stream, codec) for _ in range(count)]
+    return asyncio.run(read())
+
+
+class FramingTest(unittest.TestCase):
+    def test_coalesced_frames_stay_apart(self):
+        data = encode_message({"type": "a"}) + encode_message({"type": "b"})
+        reader = FrameReader(ChunkedSocket(data, chunk=len(data)))
+        self.assertEqual(reader.read_message(), {"type": "a"})
+        self.assertEqual(reader.read_message(), {"type": "b"})
+        self.assertEqual(read_async(data, count=2), [{"type": "a"}, {"type": "b"}])
+
+    def test_frame_split_across_reads(self):
+        data = encode_message(BIG_MESSAGE)
+        reader = FrameReader(ChunkedSocket(data), buffer_size=16)  # the buffer has to grow too
+        self.assertEqual(reader.read_message(), BIG_MESSAGE)
+        self.assertEqual(read_async(data), [BIG_MESSAGE])
+
+    def test_closed_mid_frame(self):
+        data = encode_message(BIG_MESSAGE)
+        with self.assertRaises(ConnectionError):
+            FrameReader(ChunkedSocket(data[:-1])).read_message()
+        with self.assertRaises(asyncio.IncompleteReadError):
+            read_async(data[:-1])
+
+    def test_oversized_length_rejected(self):
+        header = HEADER.pack(KIND_JSON, MAX_FRAME_SIZE + 1)
+        with self.assertRaises(ProtocolError):
+            FrameReader(ChunkedSocket(header)).read_message()
+        with self.assertRaises(ProtocolError):
+            read_async(header)
+
+
+class CompressionTest(unittest.TestCase):
+    def test_choose_codec(self):
+        self.assertEqual(choose_codec(["zlib"]), "zlib")
+        self.assertEqual(choose_codec(list(CODECS)), next(iter(CODECS)))  # the server's preference
+        self.assertIsNone(choose_codec(["brotli"]))
+        self.assertIsNone(choose_codec(None))
+
+    def round_trip(self, codec):
+        data = encode_message(BIG_MESSAGE, codec)
+        self.assertTrue(data[0] & FLAG_COMPRESSED)
+        self.assertLess(len(data), len(encode_message(BIG_MESSAGE)))
+        self.assertEqual(FrameReader(ChunkedSocket(data), codec=codec).read_message(), BIG_MESSAGE)
+        self.assertEqual(read_async(data, codec), [BIG_MESSAGE])
+
+    def test_zlib_round_trip(self):
+        self.round_trip("zlib")
+
+    @unittest.skipUnless("zstd" in CODECS, "zstd needs Python 3.14")
+    def test_zstd_round_trip(self):
+        self.round_trip("zstd")
+
+    def test_small_frames_sent_raw(self):
+        data = encode_message({"type": "a"}, "zlib")
+        self.assertFalse(data[0] & FLAG_COMPRESSED)
+        self.assertEqual(FrameReader(ChunkedSocket(data), codec="zlib").read_message(), {"type": "a"})
+
+    def test_compressed_frame_needs_a_codec(self):
+        data = encode_message(BIG_MESSAGE, "zlib")
+        with self.assertRaises(ProtocolError):
+            FrameReader(ChunkedSocket(data)).read_message()
+
+
+class OutboundMessageTest(unittest.TestCase):
+    def test_completes_once_after_seal(self):
+        completed = []
+        outbound = OutboundMessage({"type": "scores"},
+                                   on_complete=lambda message: completed.append(message.recipients))
+        # Copies settled while the fan-out is still going, as relayed and dropped sends do
+        for _ in range(2):
+            outbound.queued()
+            outbound.record_sent(len(outbound))
+        self.assertEqual(completed, [])
+        outbound.queued()
+        outbound.seal()
+        self.assertEqual(completed, [])
+        outbound.record_dropped()
+        self.assertEqual(completed, [2])
+        self.assertEqual((outbound.recipients, outbound.dropped), (2, 1))
+
+    def test_completes_on_seal_without_recipients(self):
+        completed = []
+        outbound = OutboundMessage({"type": "scores"}, on_complete=completed.append)
+        outbound.seal()
+        self.assertEqual(completed, [outbound])
+
+
+if __name__ == "__main__":
+    unittest.main()
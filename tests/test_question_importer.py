@@ -0,0 +1,53 @@
+# test_question_importer.py
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server")))
+import pandas as pd
+from question_importer import QuestionImporter
+
+NAN = float("nan")
+
+
+def sheet(*rows):
+    columns = ["question", "option_1", "option_2", "option_3", "option_4", "correct_answer"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+class ValidateExcelFormatTest(unittest.TestCase):
+    def setUp(self):
+        self.importer = QuestionImporter()
+
+    def test_classifies_rows(self):
+        types = self.importer.validate_excel_format(sheet(
+            ("Capital of France?", "Paris", "Rome", "Oslo", "Bern", 1),
+            ("Spell 'cat'", "cat", NAN, NAN, NAN, NAN)))
+        self.assertEqual(list(types), ["multiple_choice", "short_answer"])
+
+    def test_lists_every_bad_row(self):
+        with self.assertRaises(ValueError) as raised:
+            self.importer.validate_excel_format(sheet(
+                ("Fine", "a", "b", "c", "d", 2),
+                ("Missing option", "a", "b", NAN, "d", 1),
+                ("Out of range", "a", "b", "c", "d", 5),
+                ("Fine too", "only", NAN, NAN, NAN, NAN),
+                ("Short with answer", "only", NAN, NAN, NAN, 1),
+                ("Not a number", "a", "b", "c", "d", "two")))
+        message = str(raised.exception)
+        self.assertIn("4 invalid row(s)", message)
+        # Excel row numbers: the header is row 1
+        for row in (3, 4, 6, 7):
+            self.assertIn(f"Row {row}:", message)
+        for row in (2, 5):
+            self.assertNotIn(f"Row {row}:", message)
+        self.assertIn("Found: 5", message)
+        self.assertIn("Short with answer", message)
+
+    def test_missing_columns(self):
+        with self.assertRaises(ValueError) as raised:
+            self.importer.validate_excel_format(pd.DataFrame({"question": ["Q"], "option_1": ["a"]}))
+        self.assertIn("option_2, option_3, option_4, correct_answer", str(raised.exception))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+# test_recovery.py
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server")))
+from protocol import client_handshake_async
+from quiz_engine import QuizEngine
+
+DECK = [{
+    "question": f"Question {number + 1}",
+    "type": "multiple_choice",
+    "options": ["A", "B", "C", "D"],
+    "correct": 0,
+    "image": None
+} for number in range(3)]
+
+
+class Player:
+    """Just enough of a ClientConnection for the engine"""
+
+    gateway = None
+    queue = ()
+    queued_bytes = 0
+
+    def __init__(self, name):
+        self.name = name
+        self.last_seen = time.monotonic()
+        self.rtt = None
+
+    def send(self, message, droppable=False):
+        pass
+
+    def close(self, abort=False):
+        pass
+
+
+def join(engine, player_name, token=None):
+    token, resumed = engine.admit(player_name, token)
+    player = Player(player_name)
+    engine.add_player(player, resumed)
+    return player, token
+
+
+class RecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.log_path = os.path.join(self.directory.name, "quiz.log")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def run_engine(self, play, **options):
+        """Run play(engine) on a fresh engine, then drop it as if the process had died"""
+        async def run():
+            engine = QuizEngine(log_path=self.log_path, auto_advance=False, **options)
+            engine.attach(asyncio.get_running_loop())
+            try:
+                return await play(engine)
+            finally:
+                await asyncio.sleep(engine.event_log.batch_interval * 2)  # last batch hits the disk
+                engine.detach()
+        return asyncio.run(run())
+
+    def test_lobby_before_deck(self):
+        async def play(engine):
+            early, _ = join(engine, "early")
+            engine.scorer.flush()
+            engine.load_questions(DECK)
+            late, _ = join(engine, "late")
+            engine.start_quiz()
+            engine.scorer.flush()
+            for player in (early, late):
+                engine.handle_client_message(
+                    player, {"type": "multiple_choice", "answer": 0}, time.monotonic())
+            engine.close_question()
+            return dict(engine.snapshot.scores)
+
+        async def recover(engine):
+            engine.load_questions(DECK)
+            return dict(engine.snapshot.scores)
+
+        before = self.run_engine(play)
+        self.assertEqual(set(before), {"early", "late"})
+        self.assertEqual(self.run_engine(recover), before)
+
+    def test_rejoin_before_reload(self):
+        async def play(engine):
+            player, token = join(engine, "early")
+            engine.load_questions(DECK)
+            engine.start_quiz()
+            engine.scorer.flush()
+            engine.handle_client_message(
+                player, {"type": "multiple_choice", "answer": 0}, time.monotonic())
+            engine.close_question()
+            return dict(engine.snapshot.scores), token
+
+        async def rejoin(engine):
+            # Clients retry on their own: one is back before the host reloads the deck
+            _, token = join(engine, "newcomer")
+            engine.scorer.flush()
+            engine.load_questions(DECK)
+            return dict(engine.snapshot.scores), dict(engine.sessions), token
+
+        before, token = self.run_engine(play)
+        scores, sessions, newcomer_token = self.run_engine(rejoin)
+        self.assertEqual(scores, dict(before, newcomer=0))
+        self.assertEqual(sessions, {token: "early", newcomer_token: "newcomer"})
+
+        async def reload_again(engine):
+            _, token = join(engine, "third")
+            engine.scorer.flush()
+            engine.load_questions(DECK)  # from the snapshot the last recovery wrote
+            return dict(engine.snapshot.scores), dict(engine.sessions), token
+
+        # The merged state was logged too
+        scores_again, sessions_again, third_token = self.run_engine(reload_again)
+        self.assertEqual(scores_again, dict(scores, third=0))
+        self.assertEqual(sessions_again, dict(sessions, **{third_token: "third"}))
+
+    def test_resume_after_recovery(self):
+        async def play(engine):
+            players = {name: join(engine, name) for name in ("back", "gone")}
+            engine.load_questions(DECK)
+            engine.start_quiz()
+            engine.scorer.flush()
+            for player, _ in players.values():
+                engine.handle_client_message(
+                    player, {"type": "multiple_choice", "answer": 0}, time.monotonic())
+            engine.close_question()
+            return dict(engine.snapshot.scores), players["back"][1]
+
+        async def resume(engine):
+            engine.load_questions(DECK)
+            server = await asyncio.start_server(engine.handle_connection, "127.0.0.1", 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                # Longer than a dropped connection is kept, shorter than a crash is
+                await asyncio.sleep(engine.session_grace * 3)
+                reader, writer = await asyncio.open_connection("127.0.0.1", port)
+                welcome = await client_handshake_async(reader, writer, "back", session=token)
+                await asyncio.sleep(0.05)  # the engine seats the resumed connection
+                held = dict(engine.snapshot.scores)
+                await asyncio.sleep(engine.recovery_grace)
+                engine.scorer.flush()
+                expired = dict(engine.snapshot.scores)
+                writer.close()
+                await writer.wait_closed()
+                return welcome, held, expired
+            finally:
+                server.close()
+                await server.wait_closed()
+
+        before, token = self.run_engine(play)
+        self.assertGreater(before["back"], 0)
+        welcome, held, expired = self.run_engine(resume, session_grace=0.1, recovery_grace=0.5)
+        self.assertTrue(welcome["resumed"])
+        self.assertEqual(welcome["session"], token)
+        self.assertEqual(held, before)  # both seats outlast session_grace
+        self.assertEqual(expired, {"back": before["back"]})  # only the missing player left
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+# test_rooms.py
+import os
+import queue
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import pandas as pd
+from protocol import client_handshake, send_message
+
+HEADLESS = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server", "headless.py"))
+PORT = 5098
+TIMEOUT = 30  # seconds any single step may take
+
+
+class HeadlessRun:
+    """A headless server process whose output is read line by line"""
+
+    def __init__(self, args):
+        self.process = subprocess.Popen(
+            [sys.executable, HEADLESS] + args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+            text=True, env=dict(os.environ, PYTHONUNBUFFERED="1"))
+        self.lines = queue.Queue()
+        self.output = []
+        self.reader = threading.Thread(target=self.read_output, daemon=True)
+        self.reader.start()
+
+    def read_output(self):
+        for line in self.process.stdout:
+            self.lines.put(line.rstrip("\n"))
+
+    def wait_for(self, prefix):
+        """Return the first output line starting with prefix"""
+        deadline = time.monotonic() + TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                line = self.lines.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            self.output.append(line)
+            if line.startswith(prefix):
+                return line
+        raise AssertionError(f"No {prefix!r} line in:\n" + "\n".join(self.output))
+
+    def kill(self):
+        """Die without any cleanup, like a crash"""
+        self.process.kill()
+        self.process.wait()
+        self.reader.join(TIMEOUT)
+        self.process.stdout.close()
+
+
+def join(room, player_name, session=None):
+    sock = socket.create_connection(("127.0.0.1", PORT), timeout=TIMEOUT)
+    return sock, client_handshake(sock, player_name, session=session, room=room)
+
+
+def read_until(reader, message_type):
+    while True:
+        message = reader.read_message()
+        if isinstance(message, dict) and message.get("type") == message_type:
+            return message
+
+
+class RoomRecoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.runs = []
+        self.sockets = []
+        deck_path = os.path.join(self.directory.name, "deck.xlsx")
+        pd.DataFrame({
+            "question": ["Question 1", "Question 2"],
+            "option_1": ["A", "A"], "option_2": ["B", "B"],
+            "option_3": ["C", "C"], "option_4": ["D", "D"],
+            "correct_answer": [1, 1]
+        }).to_excel(deck_path, index=False)
+        self.args = [deck_path, "--rooms", "1", "--host", "127.0.0.1", "--port", str(PORT),
+                     "--min-players", "2", "--question-time", "30", "--advance-delay", "60",
+                     "--log", os.path.join(self.directory.name, "quiz.log"),
+                     "--results", os.path.join(self.directory.name, "results.json"),
+                     "--export", os.path.join(self.directory.name, "export")]
+
+    def tearDown(self):
+        for sock in self.sockets:
+            sock.close()
+        for run in self.runs:
+            run.kill()
+        self.directory.cleanup()
+
+    def start(self):
+        run = HeadlessRun(self.args)
+        self.runs.append(run)
+        return run, run.wait_for("Players join room").split()[-1]
+
+    def connect(self, room, player_name, session=None):
+        sock, reader = join(room, player_name, session)
+        self.sockets.append(sock)
+        return reader
+
+    def test_room_reopens_after_kill(self):
+        run, room = self.start()
+        readers = {name: self.connect(room, name) for name in ("alice", "bob")}
+        for reader in readers.values():
+            read_until(reader, "question")
+        send_message(self.sockets[0], {"type": "multiple_choice", "answer": 0})
+        send_message(self.sockets[1], {"type": "multiple_choice", "answer": 1})
+        points = read_until(readers["alice"], "question_closed")["points"]
+        self.assertGreater(points["alice"], 0)
+        time.sleep(0.5)  # the log's last batch hits the disk
+        run.kill()
+
+        run, reopened = self.start()
+        self.assertEqual(reopened, room)
+        run.wait_for("Recovered quiz")
+        reader = self.connect(room, "alice", readers["alice"].session)
+        self.assertTrue(reader.resumed)
+        standings = dict(map(tuple, read_until(reader, "leaderboard")["top"]))
+        self.assertEqual(standings, {"alice": points["alice"], "bob": 0})
+
+
+if __name__ == "__main__":
+    unittest.main()
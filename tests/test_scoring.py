@@ -0,0 +1,42 @@
+# test_scoring.py
+import os
+import sys
+import unittest
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "server")))
+from scoring import MAX_POINTS, MAX_STREAK_BONUS, STREAK_BONUS, answer_points
+
+
+class AnswerPointsTest(unittest.TestCase):
+    def test_speed_decay(self):
+        cases = [
+            # elapsed, time limit, points
+            (0, 20, MAX_POINTS),
+            (-0.5, 20, MAX_POINTS),  # clock jitter before the question opened
+            (10, 20, 750),
+            (20, 20, 500),  # half at the limit
+            (25, 20, 500),  # accepted in the grace period: never below half
+            (0, None, MAX_POINTS),
+            (60, None, MAX_POINTS),  # untimed questions do not reward speed
+        ]
+        for elapsed, time_limit, points in cases:
+            with self.subTest(elapsed=elapsed, time_limit=time_limit):
+                self.assertEqual(answer_points(elapsed, time_limit), points)
+
+    def test_streak_bonus(self):
+        cases = [
+            # correct answers in a row before this one, bonus
+            (0, 0),
+            (1, STREAK_BONUS),
+            (3, 3 * STREAK_BONUS),
+            (5, MAX_STREAK_BONUS),
+            (6, MAX_STREAK_BONUS),
+            (40, MAX_STREAK_BONUS),  # a long streak stays capped
+        ]
+        for streak, bonus in cases:
+            with self.subTest(streak=streak):
+                self.assertEqual(answer_points(0, 20, streak), MAX_POINTS + bonus)
+                self.assertEqual(answer_points(20, 20, streak), 500 + bonus)
+
+
+if __name__ == "__main__":
+    unittest.main()